@@ -4,5 +4,8 @@ from .evaluator import Evaluator
 from .env import Environment
 from .interpreter import Interpreter
 from .error import FPError
+from .limits import ExecutionLimits
+from .modules import Module, ModuleRegistry
+from .instrument import Instrumentation, Sampler, UNEVALUATED
 
 __version__ = "0.1.0"
@@ -0,0 +1,140 @@
+"""
+Cooperative evaluation for asyncio applications.
+
+Evaluation is a recursive tree walk that cannot be suspended in the middle,
+so each evaluation runs on a worker thread. The evaluator calls a
+checkpoint every slice_steps steps; there the worker pauses until the
+scheduler grants it the next slice. A scheduler grants one slice at a time,
+in FIFO order, so the evaluations of an event loop interleave fairly, and
+the loop itself keeps running while they wait or compute.
+
+    results = await asyncio.gather(*(Interpreter().run_async(source) for source in sources))
+
+Each admitted evaluation holds a worker thread until it finishes, so a
+scheduler admits at most max_tasks evaluations at once and gives them a pool
+of that many threads; later calls wait for admission. Budgets are set per
+task through the interpreter's ExecutionLimits; note that a timeout also
+counts the time spent waiting for slices.
+"""
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional
+from .error import EvaluationError
+from .limits import CHECK_INTERVAL
+
+# Evaluation steps a task may run before it yields to the others
+DEFAULT_SLICE_STEPS = 10000
+# Evaluations a scheduler runs at once; each holds a worker thread
+DEFAULT_MAX_TASKS = 32
+
+class _Task:
+    """State shared between a coroutine and the worker thread it drives"""
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.cancelled = False
+        # Completed (on the loop) when the worker pauses for its next slice
+        self.paused: asyncio.Future = loop.create_future()
+        self._resume = threading.Event()
+
+    def grant(self):
+        """Let the paused worker run one slice (called on the loop)"""
+        self.paused = self.loop.create_future()
+        self._resume.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._resume.set()
+
+    def check_cancelled(self):
+        """Stop the evaluation if the task was cancelled (called on the worker)"""
+        if self.cancelled:
+            raise EvaluationError("evaluation cancelled")
+
+    def checkpoint(self):
+        """Pause the worker until it is granted a slice (called on the worker)"""
+        self.check_cancelled()
+        self._resume.clear()
+        self.loop.call_soon_threadsafe(self._set_paused, self.paused)
+        self._resume.wait()
+        self.check_cancelled()
+
+    @staticmethod
+    def _set_paused(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+class Scheduler:
+    """
+    Grants evaluation slices to the tasks of one event loop, one at a time.
+
+    slice_steps  steps per slice; None runs each evaluation to completion on
+                 its worker without pausing (plain offloading)
+    max_tasks    evaluations admitted at once, each holding a worker thread
+                 for its whole life; further ones wait for admission
+    executor     where the workers run; defaults to a dedicated pool of
+                 max_tasks threads. A given executor must have at least
+                 max_tasks threads free, or admitted tasks wait for a thread
+                 until earlier evaluations finish.
+    """
+    def __init__(self, slice_steps: Optional[int] = DEFAULT_SLICE_STEPS,
+                 executor: Optional[Executor] = None, max_tasks: int = DEFAULT_MAX_TASKS):
+        if slice_steps is not None and slice_steps < 1:
+            raise ValueError("slice_steps must be positive")
+        if max_tasks < 1:
+            raise ValueError("max_tasks must be positive")
+        self.slice_steps = slice_steps
+        self.max_tasks = max_tasks
+        self.executor = executor or ThreadPoolExecutor(max_tasks, thread_name_prefix="fp-task")
+        self._lock: Optional[asyncio.Lock] = None
+        self._admission: Optional[asyncio.Semaphore] = None
+
+    async def run(self, interpreter, source: str) -> str:
+        """Run source on the interpreter; cancelling the coroutine stops the evaluation"""
+        if self._admission is None:
+            self._admission = asyncio.Semaphore(self.max_tasks)
+            self._lock = asyncio.Lock()
+        async with self._admission:
+            loop = asyncio.get_running_loop()
+            task = _Task(loop)
+            if self.slice_steps is None:
+                # Not paused, but still stopped by cancellation
+                done = loop.run_in_executor(self.executor, interpreter.run, source,
+                                            task.check_cancelled, CHECK_INTERVAL)
+            else:
+                done = loop.run_in_executor(self.executor, self._work, interpreter, source, task)
+            try:
+                if self.slice_steps is None:
+                    return await asyncio.shield(done)
+                # Only compete for a slice once the worker has started and paused
+                await asyncio.wait({task.paused, done}, return_when=asyncio.FIRST_COMPLETED)
+                while not done.done():
+                    async with self._lock:
+                        task.grant()
+                        await asyncio.wait({task.paused, done}, return_when=asyncio.FIRST_COMPLETED)
+                return done.result()
+            except asyncio.CancelledError:
+                task.cancel()
+                # The worker stops at its next checkpoint
+                await asyncio.wait({done})
+                raise
+
+    def _work(self, interpreter, source: str, task: _Task) -> str:
+        try:
+            task.checkpoint()
+        except EvaluationError:
+            return "Error: evaluation cancelled"
+        return interpreter.run(source, task.checkpoint, self.slice_steps)
+
+# One scheduler per event loop, so that tasks of the same loop share slices
+_default_schedulers: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Scheduler]' = \
+    weakref.WeakKeyDictionary()
+
+def default_scheduler() -> Scheduler:
+    """Return the scheduler of the running event loop"""
+    loop = asyncio.get_running_loop()
+    scheduler = _default_schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _default_schedulers[loop] = Scheduler()
+    return scheduler
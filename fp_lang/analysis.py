@@ -0,0 +1,92 @@
+from dataclasses import fields
+from typing import FrozenSet
+from .ast_nodes import *
+
+def free_variables(node: Node) -> FrozenSet[str]:
+    """Return the names an expression reads from its enclosing scopes"""
+    if isinstance(node, Number) or isinstance(node, Import):
+        return frozenset()
+
+    if isinstance(node, Identifier):
+        return frozenset([node.name])
+
+    if isinstance(node, QualifiedName):
+        return frozenset([node.module])
+
+    if isinstance(node, FunctionCall):
+        callee = node.name if node.module is None else node.module
+        return frozenset([callee]).union(*(free_variables(arg) for arg in node.arguments))
+
+    if isinstance(node, FunctionDef):
+        return free_variables(node.body) - set(node.params) - {node.name}
+
+    if isinstance(node, Lambda):
+        return free_variables(node.body) - set(node.params)
+
+    if isinstance(node, LetBinding):
+        return free_variables(node.value) | (free_variables(node.body) - {node.name})
+
+    # Any other node reads the union of its children
+    result = frozenset()
+    for field in fields(node):
+        value = getattr(node, field.name)
+        if isinstance(value, Node):
+            result |= free_variables(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, Node):
+                    result |= free_variables(item)
+    return result
+
+# Built-ins that always evaluate all of their arguments
+STRICT_BUILTINS = frozenset(["head", "tail", "length", "get_tuple_element",
+                             "sort", "reverse", "nth", "slice", "range", "zip", "fold"])
+
+def strict_variables(node: Node, builtins: FrozenSet[str] = STRICT_BUILTINS) -> FrozenSet[str]:
+    """
+    Return the names that are certainly read whenever the expression is
+    evaluated. The analysis is conservative: a name missing from the result
+    may or may not be used. Calls to the given names are assumed to reach
+    the strict built-ins, unless a let inside the expression rebinds them.
+    """
+    if isinstance(node, Identifier):
+        return frozenset([node.name])
+
+    if isinstance(node, QualifiedName):
+        return frozenset([node.module])
+
+    if isinstance(node, BinaryOp):
+        return strict_variables(node.left, builtins) | strict_variables(node.right, builtins)
+
+    if isinstance(node, IfExpr):
+        branches = strict_variables(node.then_branch, builtins) & strict_variables(node.else_branch, builtins)
+        return strict_variables(node.condition, builtins) | branches
+
+    if isinstance(node, LetBinding):
+        body = strict_variables(node.body, builtins - {node.name})
+        if node.name in body:
+            return (body - {node.name}) | strict_variables(node.value, builtins)
+        return body
+
+    if isinstance(node, FunctionCall):
+        if node.module is not None:
+            return frozenset([node.module])
+        if node.name in builtins:
+            return frozenset([node.name]).union(*(strict_variables(arg, builtins) for arg in node.arguments))
+        # Arguments of user functions may be left unevaluated
+        return frozenset([node.name])
+
+    if isinstance(node, Apply):
+        return strict_variables(node.callee, builtins)
+
+    if isinstance(node, List):
+        return frozenset().union(*(strict_variables(elem, builtins) for elem in node.elements))
+
+    if isinstance(node, CSEScope):
+        return strict_variables(node.body, builtins)
+
+    if isinstance(node, CSERef):
+        return strict_variables(node.expr, builtins)
+
+    # Numbers, imports and function definitions evaluate nothing
+    return frozenset()
@@ -1,5 +1,6 @@
-from dataclasses import dataclass
-from typing import List, Optional, Any
+from dataclasses import dataclass, field
+from typing import List, Optional, Any, FrozenSet
+from .numeric import Numeric
 
 @dataclass
 class Node:
@@ -8,7 +9,7 @@ class Node:
 
 @dataclass
 class Number(Node):
-    value: int
+    value: Numeric
     
     def __str__(self) -> str:
         return str(self.value)
@@ -34,6 +35,8 @@ class FunctionDef(Node):
     name: str
     params: List[str]
     body: Node
+    # Names captured by closure conversion, computed on first evaluation
+    free_vars: Optional[FrozenSet[str]] = field(default=None, compare=False, repr=False)
     
     def __str__(self) -> str:
         params_str = ", ".join(self.params)
@@ -43,11 +46,34 @@ class FunctionDef(Node):
 class FunctionCall(Node):
     name: str
     arguments: List[Node]
+    module: Optional[str] = None
     
     def __str__(self) -> str:
         args_str = ", ".join(str(arg) for arg in self.arguments)
+        if self.module is not None:
+            return f"{self.module}.{self.name}({args_str})"
         return f"{self.name}({args_str})"
 
+@dataclass
+class Lambda(Node):
+    params: List[str]
+    body: Node
+    # Names captured by closure conversion, computed on first evaluation
+    free_vars: Optional[FrozenSet[str]] = field(default=None, compare=False, repr=False)
+    
+    def __str__(self) -> str:
+        params_str = ", ".join(self.params)
+        return f"fn({params_str}) = {self.body}"
+
+@dataclass
+class Apply(Node):
+    callee: Node
+    arguments: List[Node]
+    
+    def __str__(self) -> str:
+        args_str = ", ".join(str(arg) for arg in self.arguments)
+        return f"({self.callee})({args_str})"
+
 @dataclass
 class IfExpr(Node):
     condition: Node
@@ -66,6 +92,39 @@ class LetBinding(Node):
     def __str__(self) -> str:
         return f"let {self.name} = {self.value} in {self.body}"
 
+@dataclass
+class Import(Node):
+    module: str
+    
+    def __str__(self) -> str:
+        return f"import {self.module}"
+
+@dataclass
+class QualifiedName(Node):
+    module: str
+    name: str
+    
+    def __str__(self) -> str:
+        return f"{self.module}.{self.name}"
+
+@dataclass
+class CSEScope(Node):
+    """Scope holding the cache slots of common subexpressions"""
+    slots: List[str]
+    body: Node
+    
+    def __str__(self) -> str:
+        return str(self.body)
+
+@dataclass
+class CSERef(Node):
+    """Common subexpression, evaluated once per scope and cached in a slot"""
+    slot: str
+    expr: Node
+    
+    def __str__(self) -> str:
+        return str(self.expr)
+
 @dataclass
 class List(Node):
     elements: List[Node]
@@ -7,6 +7,31 @@ class Function:
     params: list[str]
     body: Node
     env: 'Environment'
+    name: Optional[str] = None
+
+@dataclass(frozen=True)
+class Builtin:
+    """
+    Reference to a built-in function. Built-ins are implemented by each
+    evaluator, so calling a reference always runs against the evaluator
+    making the call, with its limits and hooks.
+    """
+    name: str
+
+class Thunk:
+    """Delayed evaluation of an expression, memoized on first use"""
+    def __init__(self, node: Node, env: 'Environment', evaluator):
+        self.node = node
+        self.env = env
+        self.evaluator = evaluator
+        self.value = None
+
+    def force(self) -> Any:
+        if self.node is not None:
+            self.value = self.evaluator._eval(self.node, self.env)
+            # Release the expression and its scope once evaluated
+            self.node = self.env = self.evaluator = None
+        return self.value
 
 class Environment:
     def __init__(self, parent: Optional['Environment'] = None):
@@ -40,3 +65,25 @@ class Environment:
     def extend(self) -> 'Environment':
         """Create a new child environment"""
         return Environment(self)
+
+    def capture(self, names) -> 'Environment':
+        """
+        Create a closure environment holding only the given names.
+        Names bound in the global (root) scope are not copied: they stay
+        reachable through the root, so later global definitions are seen.
+        """
+        if self.parent is None:
+            return self
+        root = self.parent
+        while root.parent is not None:
+            root = root.parent
+
+        closure = Environment(root)
+        for name in names:
+            env = self
+            while env is not root:
+                if name in env.values:
+                    closure.values[name] = env.values[name]
+                    break
+                env = env.parent
+        return closure
@@ -1,15 +1,97 @@
-from typing import Any, List
+import builtins
+import sys
+import time
+from typing import Any, Callable, List, Optional
 from .ast_nodes import *
-from .env import Environment, Function
+from .env import Builtin, Environment, Function, Thunk
+from .error import FPError, EvaluationError
+from .limits import ExecutionLimits, CHECK_INTERVAL, FRAMES_PER_CALL, MAX_RECURSION_LIMIT
+from .modules import Module, ModuleRegistry, default_registry
+from .numeric import divide, floor_div, modulo, check_mode
+from .analysis import STRICT_BUILTINS, free_variables, strict_variables
+from .instrument import Instrumentation, ANONYMOUS, UNEVALUATED
+
+# Value of a common-subexpression slot that has not been computed yet
+_UNSET = object()
 
 class Evaluator:
-    def __init__(self, ast: Node, env: Environment):
+    def __init__(self, ast: Node, env: Environment, limits: Optional[ExecutionLimits] = None,
+                 registry: Optional[ModuleRegistry] = None, numeric: str = "float",
+                 lazy: bool = False, instrumentation: Optional[Instrumentation] = None,
+                 checkpoint: Optional[Callable[[], None]] = None,
+                 checkpoint_interval: int = CHECK_INTERVAL):
         self.ast = ast
         self.env = env
+        self.limits = limits or ExecutionLimits()
+        self.registry = registry or default_registry
+        self.numeric = check_mode(numeric)
+        self.lazy = lazy
+        self.instrumentation = instrumentation
+        # Called every checkpoint_interval steps, e.g. to pause a cooperative task
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        # False while the checkpoint must not run, e.g. while a lock is held
+        self.interruptible = True
+        self._strictness = {}
+        self._builtin_names = {}
+        # Names of the user functions being executed, innermost last
+        self.call_stack: list = []
+        self._error_stack = None
+        # Implementations of the built-ins, found after the global scope
+        self.builtins: dict = {}
+        self._setup_limits()
         self._setup_builtins()
 
+    def _setup_limits(self):
+        """Reset the resource counters and start the wall-clock timer"""
+        self.steps = 0
+        self.cells = 0
+        self._max_depth = self.limits.max_depth if self.limits.max_depth is not None else sys.maxsize
+        if self.limits.max_depth is not None:
+            # Let the depth limit be reached before Python's own recursion limit
+            frames = min(1000 + self.limits.max_depth * FRAMES_PER_CALL, MAX_RECURSION_LIMIT)
+            if sys.getrecursionlimit() < frames:
+                sys.setrecursionlimit(frames)
+        self._max_cells = self.limits.max_cells if self.limits.max_cells is not None else sys.maxsize
+        self._deadline = None
+        if self.limits.timeout is not None:
+            self._deadline = time.monotonic() + self.limits.timeout
+        self._next_checkpoint = self.checkpoint_interval
+        self._next_check = self._schedule_check()
+
+    def _schedule_check(self) -> int:
+        """Return the step count at which the limits or the checkpoint are checked next"""
+        next_check = sys.maxsize
+        if self.limits.max_steps is not None or self._deadline is not None:
+            next_check = self.steps + CHECK_INTERVAL
+            if self.limits.max_steps is not None:
+                next_check = min(next_check, self.limits.max_steps + 1)
+        if self.checkpoint is not None:
+            next_check = min(next_check, self._next_checkpoint)
+        return next_check
+
+    def _check_limits(self):
+        """
+        Enforce the step budget and the timeout (called every CHECK_INTERVAL
+        steps) and run the checkpoint when it is due
+        """
+        if self.limits.max_steps is not None and self.steps > self.limits.max_steps:
+            raise EvaluationError(f"step limit of {self.limits.max_steps} exceeded")
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise EvaluationError(f"timeout of {self.limits.timeout}s exceeded")
+        if self.checkpoint is not None and self.interruptible and self.steps >= self._next_checkpoint:
+            self._next_checkpoint = self.steps + self.checkpoint_interval
+            self.checkpoint()
+        self._next_check = self._schedule_check()
+
+    def _allocate(self, cells: int):
+        """Account for newly allocated list cells"""
+        self.cells += cells
+        if self.cells > self._max_cells:
+            raise EvaluationError(f"memory limit of {self.limits.max_cells} list cells exceeded")
+
     def _setup_builtins(self):
-        """Set up built-in functions in the environment"""
+        """Set up the built-in functions of this evaluator"""
         def head(lst):
             if not isinstance(lst, list) or len(lst) == 0:
                 raise ValueError("head: empty list")
@@ -18,6 +100,7 @@ class Evaluator:
         def tail(lst):
             if not isinstance(lst, list) or len(lst) == 0:
                 raise ValueError("tail: empty list")
+            self._allocate(len(lst) - 1)
             return lst[1:]
 
         def length(lst):
@@ -34,16 +117,265 @@ class Evaluator:
                 raise ValueError("get_tuple_element: index out of bounds")
             return tuple_val[index]
 
-        self.env.define("head", head)
-        self.env.define("tail", tail)
-        self.env.define("length", length)
-        self.env.define("get_tuple_element", get_tuple_element)
+        def check_list(name, lst):
+            if not isinstance(lst, list):
+                raise ValueError(f"{name}: not a list")
+
+        def check_function(name, function):
+            if not isinstance(function, (Function, Builtin)) and not callable(function):
+                raise ValueError(f"{name}: not a function")
+
+        def check_index(name, index):
+            if not isinstance(index, int) or isinstance(index, bool):
+                raise ValueError(f"{name}: index must be an integer")
+
+        call = self._call
+
+        class Ordered:
+            """Sort key ordering values with a user 'less than' function"""
+            __slots__ = ("value", "less")
+
+            def __init__(self, value, less):
+                self.value = value
+                self.less = less
+
+            def __lt__(self, other):
+                return bool(call(self.less, [self.value, other.value]))
+
+        def sort(lst, function=None):
+            check_list("sort", lst)
+            self._allocate(len(lst))
+            try:
+                if function is None:
+                    return sorted(lst)
+                check_function("sort", function)
+                if isinstance(function, Function) and len(function.params) not in (1, 2):
+                    raise ValueError("sort: function must take 1 parameter (a key) "
+                                     "or 2 (a comparison)")
+                if isinstance(function, Function) and len(function.params) == 2:
+                    # Comparison: function(a, b) is true when a goes before b
+                    return [item.value for item in sorted(Ordered(value, function) for value in lst)]
+                # Key: elements are ordered by function(element), computed once each
+                keys = [call(function, [value]) for value in lst]
+                order = sorted(builtins.range(len(lst)), key=keys.__getitem__)
+                return [lst[i] for i in order]
+            except TypeError:
+                raise ValueError("sort: elements cannot be compared")
+
+        def reverse(lst):
+            check_list("reverse", lst)
+            self._allocate(len(lst))
+            return lst[::-1]
+
+        def nth(lst, index):
+            check_list("nth", lst)
+            check_index("nth", index)
+            if index < 0 or index >= len(lst):
+                raise ValueError("nth: index out of bounds")
+            return lst[index]
+
+        def slice(lst, start, end):
+            check_list("slice", lst)
+            check_index("slice", start)
+            check_index("slice", end)
+            if start < 0 or end < 0:
+                raise ValueError("slice: indices must not be negative")
+            result = lst[start:end]
+            self._allocate(len(result))
+            return result
+
+        def range(start, end=None, step=1):
+            if end is None:
+                start, end = 0, start
+            for value in (start, end, step):
+                check_index("range", value)
+            if step == 0:
+                raise ValueError("range: step must not be zero")
+            result = builtins.range(start, end, step)
+            self._allocate(len(result))
+            return list(result)
+
+        def zip(first, second):
+            check_list("zip", first)
+            check_list("zip", second)
+            # Pairs are two-element lists, like tuples
+            result = [[a, b] for a, b in builtins.zip(first, second)]
+            self._allocate(3 * len(result))
+            return result
+
+        def fold(function, initial, lst):
+            check_function("fold", function)
+            check_list("fold", lst)
+            result = initial
+            for value in lst:
+                result = call(function, [result, value])
+            return result
+
+        self.builtins["head"] = head
+        self.builtins["tail"] = tail
+        self.builtins["length"] = length
+        self.builtins["get_tuple_element"] = get_tuple_element
+        self.builtins["sort"] = sort
+        self.builtins["reverse"] = reverse
+        self.builtins["nth"] = nth
+        self.builtins["slice"] = slice
+        self.builtins["range"] = range
+        self.builtins["zip"] = zip
+        self.builtins["fold"] = fold
+        self._builtin_refs = {name: Builtin(name) for name in self.builtins}
 
     def evaluate(self) -> Any:
         """Evaluate the AST and return the result"""
-        return self._eval(self.ast, self.env)
+        if self.instrumentation is None:
+            return self._eval(self.ast, self.env)
+        try:
+            return self._eval(self.ast, self.env)
+        except Exception as e:
+            stack = self._error_stack if self._error_stack is not None else tuple(self.call_stack)
+            self._error_stack = None
+            self.instrumentation.error(e, stack)
+            raise
+
+    def _lookup(self, name: str, env: Environment) -> Any:
+        """Look a name up in the scope chain, then among the built-ins"""
+        scope = env
+        while scope is not None:
+            if name in scope.values:
+                return scope.values[name]
+            scope = scope.parent
+        builtin = self._builtin_refs.get(name)
+        if builtin is None:
+            raise NameError(f"Variable '{name}' is not defined")
+        return builtin
+
+    def _strict(self, node: Node, env: Environment, bound) -> frozenset:
+        """
+        Cached strictness analysis of a let or function body evaluated in env
+        with the given names bound. Only calls to names that really resolve to
+        built-ins there are treated as strict.
+        """
+        called = self._builtin_names.get(id(node))
+        if called is None:
+            called = self._builtin_names[id(node)] = STRICT_BUILTINS & free_variables(node)
+        builtins = frozenset(name for name in called
+                             if name not in bound and self._is_builtin(name, env))
+        key = (id(node), builtins)
+        entry = self._strictness.get(key)
+        if entry is None:
+            # Keep the node alive so that its id is not reused
+            entry = self._strictness[key] = (node, strict_variables(node, builtins))
+        return entry[1]
+
+    def _is_builtin(self, name: str, env: Environment) -> bool:
+        """True if the name resolves to the built-in of that name in env"""
+        scope = env
+        while scope is not None:
+            if name in scope.values:
+                return scope.values[name] == self._builtin_refs.get(name)
+            scope = scope.parent
+        return name in self.builtins
+
+    def _delay(self, node: Node, env: Environment) -> Any:
+        """Wrap an expression in a thunk, unless it is trivial to evaluate"""
+        if isinstance(node, Number):
+            return node.value
+        if isinstance(node, Identifier):
+            # Share the (possibly unevaluated) value of the variable
+            return self._lookup(node.name, env)
+        return Thunk(node, env, self)
+
+    def _arguments(self, function: Any, nodes: list, env: Environment) -> list:
+        """Evaluate call arguments; in lazy mode only those the callee certainly uses"""
+        if self.lazy and isinstance(function, Function):
+            params = function.params
+            strict = self._strict(function.body, function.env, params)
+            return [self._eval(arg, env) if i >= len(params) or params[i] in strict
+                    else self._delay(arg, env)
+                    for i, arg in enumerate(nodes)]
+        return [self._eval(arg, env) for arg in nodes]
+
+    def _call(self, function: Any, args: list) -> Any:
+        """Call a user-defined or built-in function with evaluated arguments"""
+        if not isinstance(function, Function):
+            # Built-in (or host Python) function
+            if isinstance(function, Builtin):
+                name = function.name
+                function = self.builtins.get(name)
+                if function is None:
+                    raise ValueError(f"unknown built-in '{name}'")
+            else:
+                name = getattr(function, "__name__", ANONYMOUS)
+            if self.instrumentation is None:
+                return function(*args)
+            start = time.perf_counter()
+            result = function(*args)
+            self.instrumentation.builtin_call(name, args, result, time.perf_counter() - start)
+            return result
+
+        # Partial application: bind the given arguments and return a
+        # function of the remaining parameters
+        if len(args) < len(function.params):
+            bound_env = function.env.extend()
+            for param, arg in zip(function.params, args):
+                bound_env.define(param, arg)
+            return Function(function.params[len(args):], function.body, bound_env, function.name)
+
+        # Create new environment for function execution
+        new_env = function.env.extend()
+
+        # Bind parameters to arguments
+        for param, arg in zip(function.params, args):
+            new_env.define(param, arg)
+
+        # Execute function body in new environment
+        self.call_stack.append(function.name or ANONYMOUS)
+        try:
+            if len(self.call_stack) > self._max_depth:
+                raise EvaluationError(f"call depth limit of {self.limits.max_depth} exceeded")
+            if self.instrumentation is None:
+                return self._eval(function.body, new_env)
+            return self._traced_call(function, args, new_env)
+        finally:
+            self.call_stack.pop()
+
+    def _traced_call(self, function: Function, args: list, env: Environment) -> Any:
+        """Execute a function body, reporting it to the instrumentation hooks"""
+        name = function.name or ANONYMOUS
+        if self.lazy:
+            # Hooks must not see (or force) pending lazy values
+            args = [UNEVALUATED if type(arg) is Thunk and arg.node is not None
+                    else arg.value if type(arg) is Thunk else arg for arg in args]
+        self.instrumentation.function_enter(name, args)
+        start = time.perf_counter()
+        error = None
+        try:
+            result = self._eval(function.body, env)
+        except BaseException as e:
+            error = e
+            # Remember where the error was raised before the stack unwinds
+            if self._error_stack is None:
+                self._error_stack = tuple(self.call_stack)
+            raise
+        finally:
+            # Every enter is matched by an exit or an unwind
+            elapsed = time.perf_counter() - start
+            if error is None:
+                self.instrumentation.function_exit(name, result, elapsed)
+            else:
+                self.instrumentation.function_unwind(name, error, elapsed)
+        return result
+
+    def _member(self, module_name: str, member: str, env: Environment) -> Any:
+        """A member of an imported module, loading the module with this evaluator"""
+        module = self._lookup(module_name, env)
+        if not isinstance(module, Module):
+            raise ValueError(f"'{module_name}' is not a module")
+        return module.get(member, self)
 
     def _eval(self, node: Node, env: Environment) -> Any:
+        self.steps += 1
+        if self.steps >= self._next_check:
+            self._check_limits()
         try:
             # Numbers evaluate to themselves
             if isinstance(node, Number):
@@ -51,60 +383,92 @@ class Evaluator:
 
             # Variable lookup
             if isinstance(node, Identifier):
-                return env.get(node.name)
+                value = self._lookup(node.name, env)
+                if type(value) is Thunk:
+                    return value.force()
+                return value
 
             # Binary operations
             if isinstance(node, BinaryOp):
                 left = self._eval(node.left, env)
                 right = self._eval(node.right, env)
-                
-                if node.operator == '+':
+                op = node.operator
+
+                # Fast path for the common integer case
+                if type(left) is int and type(right) is int:
+                    if op == '+':
+                        return left + right
+                    elif op == '-':
+                        return left - right
+                    elif op == '<':
+                        return left < right
+                    elif op == '>':
+                        return left > right
+                    elif op == '=':
+                        return left == right
+                    elif op == '*':
+                        return left * right
+
+                if op == '+':
                     if isinstance(left, list) and isinstance(right, list):
+                        self._allocate(len(left) + len(right))
                         return left + right
                     return left + right
-                elif node.operator == '-':
+                elif op == '-':
                     return left - right
-                elif node.operator == '*':
+                elif op == '*':
                     return left * right
-                elif node.operator == '/':
-                    return left / right
-                elif node.operator == '>':
+                elif op == '/':
+                    return divide(left, right, self.numeric)
+                elif op == 'div':
+                    return floor_div(left, right)
+                elif op == 'mod':
+                    return modulo(left, right)
+                elif op == '>':
                     return bool(left > right)
-                elif node.operator == '<':
+                elif op == '<':
                     return bool(left < right)
-                elif node.operator == '=':
+                elif op == '=':
                     return bool(left == right)
                 else:
-                    raise ValueError(f"Unknown operator: {node.operator}")
+                    raise ValueError(f"Unknown operator: {op}")
 
             # Function definition
             if isinstance(node, FunctionDef):
-                function = Function(node.params, node.body, env)
+                if node.free_vars is None:
+                    node.free_vars = free_variables(node)
+                closure_env = env.capture(node.free_vars)
+                function = Function(node.params, node.body, closure_env, node.name)
                 env.define(node.name, function)
+                if closure_env is not env:
+                    # Let the function refer to itself recursively
+                    closure_env.define(node.name, function)
                 return function
 
+            # Anonymous function
+            if isinstance(node, Lambda):
+                if node.free_vars is None:
+                    node.free_vars = free_variables(node)
+                return Function(node.params, node.body, env.capture(node.free_vars))
+
             # Function call
             if isinstance(node, FunctionCall):
-                function = env.get(node.name)
-                if isinstance(function, Function):
-                    # Evaluate arguments
-                    args = [self._eval(arg, env) for arg in node.arguments]
-                    
-                    # Create new environment for function execution
-                    new_env = function.env.extend()
-                    
-                    # Bind parameters to arguments
-                    for param, arg in zip(function.params, args):
-                        new_env.define(param, arg)
-                    
-                    # Execute function body in new environment
-                    return self._eval(function.body, new_env)
-                elif callable(function):
-                    # Handle built-in functions
-                    args = [self._eval(arg, env) for arg in node.arguments]
-                    return function(*args)
+                if node.module is None:
+                    function = self._lookup(node.name, env)
                 else:
+                    function = self._member(node.module, node.name, env)
+                if not isinstance(function, (Function, Builtin)) and not callable(function):
                     raise ValueError(f"'{node.name}' is not a function")
+                args = self._arguments(function, node.arguments, env)
+                return self._call(function, args)
+
+            # Call of an arbitrary expression value
+            if isinstance(node, Apply):
+                function = self._eval(node.callee, env)
+                if not isinstance(function, (Function, Builtin)) and not callable(function):
+                    raise ValueError(f"'{node.callee}' is not a function")
+                args = self._arguments(function, node.arguments, env)
+                return self._call(function, args)
 
             # If expression
             if isinstance(node, IfExpr):
@@ -116,15 +480,46 @@ class Evaluator:
 
             # Let binding
             if isinstance(node, LetBinding):
-                value = self._eval(node.value, env)
+                if self.lazy and node.name not in self._strict(node.body, env, (node.name,)):
+                    value = self._delay(node.value, env)
+                else:
+                    value = self._eval(node.value, env)
                 new_env = env.extend()
                 new_env.define(node.name, value)
                 return self._eval(node.body, new_env)
 
+            # Import binds the module name; loading is deferred to first use
+            if isinstance(node, Import):
+                module = Module(node.module, self.registry)
+                env.define(node.module, module)
+                return module
+
+            # Qualified access to a module member
+            if isinstance(node, QualifiedName):
+                return self._member(node.module, node.name, env)
+
+            # Common subexpression, computed on first use within its scope
+            if isinstance(node, CSERef):
+                value = env.get(node.slot)
+                if value is _UNSET:
+                    value = self._eval(node.expr, env)
+                    env.assign(node.slot, value)
+                return value
+
+            if isinstance(node, CSEScope):
+                for slot in node.slots:
+                    env.define(slot, _UNSET)
+                return self._eval(node.body, env)
+
             # List literal
             if isinstance(node, List):
+                self._allocate(len(node.elements))
                 return [self._eval(elem, env) for elem in node.elements]
 
             raise ValueError(f"Unknown node type: {type(node)}")
+        except FPError:
+            raise
+        except RecursionError:
+            raise EvaluationError("maximum recursion depth exceeded")
         except Exception as e:
             raise ValueError(f"Evaluation error at {node}: {str(e)}")
@@ -0,0 +1,456 @@
+"""
+Differential fuzzing of the evaluation engines.
+
+Random programs are generated over the AST grammar and run through every
+engine (eager and lazy evaluation at each optimization level, plus a
+print-and-reparse round trip), each program in one numeric mode. Results
+and errors are compared with the plain eager evaluator; divergences and
+performance outliers are shrunk to minimal reproducers.
+
+    python -m fp_lang.fuzz --count 500 --seed 1
+"""
+import argparse
+import random
+import sys
+import time
+from dataclasses import dataclass, field, fields, replace
+from decimal import Decimal
+from fractions import Fraction
+from typing import Any, Callable, Dict, List as TypeList, Optional, Tuple
+from .ast_nodes import *
+from .env import Builtin, Environment, Function
+from .evaluator import Evaluator
+from .lexer import Lexer
+from .parser import Parser
+from .limits import ExecutionLimits
+from .numeric import NUMERIC_MODES, parse_number
+from .optimize import optimize
+
+NUM = "num"
+LIST = "list"
+
+@dataclass
+class Engine:
+    name: str
+    lazy: bool = False
+    optimize: int = 0
+    reparse: bool = False  # print the program as source and parse it again
+
+# The first engine is the reference the others are compared with
+ENGINES = [
+    Engine("eager"),
+    Engine("eager-O1", optimize=1),
+    Engine("eager-O2", optimize=2),
+    Engine("lazy", lazy=True),
+    Engine("lazy-O1", lazy=True, optimize=1),
+    Engine("lazy-O2", lazy=True, optimize=2),
+    Engine("reparsed", reparse=True),
+]
+
+@dataclass
+class Outcome:
+    ok: bool
+    value: Any = None
+    elapsed: float = 0.0          # evaluation only
+    prepare_time: float = 0.0     # reparsing and optimization passes
+    error: Optional[str] = None  # exception type and normalized message
+
+@dataclass
+class Finding:
+    kind: str             # "divergence" or "outlier"
+    engine: str
+    program: TypeList[Node]
+    reproducer: str       # source of the shrunk program
+    details: str
+    numeric: str = "float"  # numeric mode the program ran in
+
+@dataclass
+class FuzzReport:
+    programs: int = 0
+    findings: TypeList[Finding] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)  # total evaluation seconds per engine
+    prepare_timings: Dict[str, float] = field(default_factory=dict)  # total seconds in the passes
+
+def to_source(program: TypeList[Node]) -> str:
+    """
+    Render a program as source code that parses back to the same AST (in the
+    numeric mode of its literals). Optimized programs are rendered as the
+    source they were optimized from.
+    """
+    return "\n".join(_source(node) for node in program)
+
+def _source(node: Node) -> str:
+    if isinstance(node, Number):
+        if node.value < 0:
+            return f"(0 - {_number_source(-node.value)})"
+        return _number_source(node.value)
+    if isinstance(node, Identifier):
+        return node.name
+    if isinstance(node, Import):
+        return f"import {node.module}"
+    if isinstance(node, QualifiedName):
+        return f"{node.module}.{node.name}"
+    if isinstance(node, CSEScope):
+        return _source(node.body)
+    if isinstance(node, CSERef):
+        return _source(node.expr)
+    if isinstance(node, BinaryOp):
+        return f"({_source(node.left)} {node.operator} {_source(node.right)})"
+    if isinstance(node, IfExpr):
+        return (f"(if {_source(node.condition)} then ({_source(node.then_branch)}) "
+                f"else ({_source(node.else_branch)}))")
+    if isinstance(node, LetBinding):
+        return f"(let {node.name} = ({_source(node.value)}) ({_source(node.body)}))"
+    if isinstance(node, FunctionDef):
+        return f"def {node.name}({', '.join(node.params)}) = ({_source(node.body)})"
+    if isinstance(node, Lambda):
+        return f"(fn({', '.join(node.params)}) = ({_source(node.body)}))"
+    if isinstance(node, FunctionCall):
+        name = node.name if node.module is None else f"{node.module}.{node.name}"
+        return f"{name}({', '.join(_source(arg) for arg in node.arguments)})"
+    if isinstance(node, Apply):
+        return f"({_source(node.callee)})({', '.join(_source(arg) for arg in node.arguments)})"
+    if isinstance(node, List):
+        return f"[{', '.join(_source(elem) for elem in node.elements)}]"
+    raise ValueError(f"Cannot render {type(node).__name__} as source")
+
+def _number_source(value) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, Fraction):
+        # Rational literals are written in decimal notation
+        text = str(Decimal(value.numerator) / value.denominator)
+    elif isinstance(value, Decimal):
+        text = format(value, 'f')
+    else:
+        text = repr(value)
+    if '.' not in text:
+        text += ".0"
+    if type(value)(text) != value:
+        raise ValueError(f"Cannot render {value!r} as a literal")
+    return text
+
+class ProgramGenerator:
+    """Generate random, terminating, mostly well-typed programs"""
+    def __init__(self, rng: random.Random, max_depth: int = 4):
+        self.rng = rng
+        self.max_depth = max_depth
+        self.numeric = "float"
+
+    def program(self, numeric: str = "float") -> TypeList[Node]:
+        """Generate a program whose literals have the values of the given numeric mode"""
+        self.numeric = numeric
+        self._counter = 0
+        self._functions: TypeList[Tuple[str, TypeList[str], str]] = []
+        nodes = []
+        for i in range(self.rng.randint(0, 3)):
+            param_types = [self._type() for _ in range(self.rng.randint(1, 3))]
+            params = [self._fresh() for _ in param_types]
+            result_type = self._type()
+            body = self.expr(result_type, self.max_depth, dict(zip(params, param_types)))
+            # Functions only call earlier ones, so programs always terminate
+            self._functions.append((f"f{i}", param_types, result_type))
+            nodes.append(FunctionDef(f"f{i}", params, body))
+        nodes.append(self.expr(self._type(), self.max_depth, {}))
+        return nodes
+
+    def _type(self) -> str:
+        return NUM if self.rng.random() < 0.7 else LIST
+
+    def _fresh(self) -> str:
+        self._counter += 1
+        return f"v{self._counter}"
+
+    def expr(self, kind: str, depth: int, scope: Dict[str, str]) -> Node:
+        if depth <= 0 or self.rng.random() < 0.2:
+            return self._leaf(kind, scope)
+
+        choice = self.rng.random()
+        if choice < 0.12:
+            cond = self.expr(NUM, depth - 1, scope)
+            return IfExpr(cond, self.expr(kind, depth - 1, scope), self.expr(kind, depth - 1, scope))
+        if choice < 0.24:
+            name = self._fresh()
+            value_type = self._type()
+            value = self.expr(value_type, depth - 1, scope)
+            body = self.expr(kind, depth - 1, dict(scope, **{name: value_type}))
+            return LetBinding(name, value, body)
+        if choice < 0.32 and self._functions:
+            return self._call(kind, depth, scope)
+        if choice < 0.38:
+            # Immediately applied lambda, capturing variables in scope
+            param = self._fresh()
+            param_type = self._type()
+            body = self.expr(kind, depth - 1, dict(scope, **{param: param_type}))
+            return Apply(Lambda([param], body), [self.expr(param_type, depth - 1, scope)])
+        if choice < 0.44:
+            # Repeated subexpression, to exercise hash-consing and CSE
+            shared = self.expr(kind, depth - 1, scope)
+            op = '+' if kind == LIST else self.rng.choice(['+', '-', '*', '='])
+            return BinaryOp(shared, op, shared)
+
+        if kind == LIST:
+            return self._list_expr(depth, scope)
+        return self._num_expr(depth, scope)
+
+    def _num_expr(self, depth: int, scope: Dict[str, str]) -> Node:
+        choice = self.rng.random()
+        if choice < 0.15:
+            return FunctionCall("length", [self.expr(LIST, depth - 1, scope)])
+        if choice < 0.25:
+            return FunctionCall("head", [self.expr(LIST, depth - 1, scope)])
+        op = self.rng.choice(['+', '-', '*', '/', 'div', 'mod', '<', '>', '='])
+        return BinaryOp(self.expr(NUM, depth - 1, scope), op, self.expr(NUM, depth - 1, scope))
+
+    def _list_expr(self, depth: int, scope: Dict[str, str]) -> Node:
+        choice = self.rng.random()
+        if choice < 0.3:
+            return FunctionCall("tail", [self.expr(LIST, depth - 1, scope)])
+        if choice < 0.6:
+            return BinaryOp(self.expr(LIST, depth - 1, scope), '+', self.expr(LIST, depth - 1, scope))
+        return List([self.expr(NUM, depth - 1, scope) for _ in range(self.rng.randint(0, 3))])
+
+    def _call(self, kind: str, depth: int, scope: Dict[str, str]) -> Node:
+        candidates = [f for f in self._functions if f[2] == kind] or self._functions
+        name, param_types, result_type = self.rng.choice(candidates)
+        args = [self.expr(t, depth - 1, scope) for t in param_types]
+        split = self.rng.randint(0, len(args) - 1) if self.rng.random() < 0.2 else len(args)
+        node = FunctionCall(name, args[:split])
+        if split < len(args):
+            # Partial application followed by a call with the rest
+            node = Apply(node, args[split:])
+        return node
+
+    def _leaf(self, kind: str, scope: Dict[str, str]) -> Node:
+        names = [name for name, t in scope.items() if t == kind]
+        if names and self.rng.random() < 0.6:
+            return Identifier(self.rng.choice(names))
+        if kind == LIST:
+            return List([self._number() for _ in range(self.rng.randint(0, 3))])
+        return self._number()
+
+    def _number(self) -> Number:
+        if self.rng.random() < 0.7:
+            return Number(self.rng.randint(0, 9))
+        # Decimal literals; trailing zeros give equal ones written differently (1.5, 1.50)
+        last = self.rng.choice(["", "0", str(self.rng.randint(1, 9))])
+        text = f"{self.rng.randint(0, 9)}.{self.rng.randint(0, 9)}{last}"
+        return Number(parse_number(text, self.numeric))
+
+def run_engine(engine: Engine, program: TypeList[Node], limits: Optional[ExecutionLimits] = None,
+               numeric: str = "float") -> Outcome:
+    """
+    Evaluate a program with one engine in a numeric mode; the result is that of
+    the last expression. The engine's passes (reparsing, optimization) are timed
+    apart from evaluation.
+    """
+    start = time.perf_counter()
+    prepare_time = 0.0
+    try:
+        if engine.reparse:
+            program = Parser(Lexer(to_source(program)).tokenize(), numeric).parse()
+        program = optimize(program, engine.optimize)
+        prepare_time = time.perf_counter() - start
+        start = time.perf_counter()
+        evaluator = Evaluator(None, Environment(), limits, numeric=numeric, lazy=engine.lazy)
+        result = None
+        for expr in program:
+            evaluator.ast = expr
+            result = evaluator.evaluate()
+        return Outcome(True, _normalize(result), time.perf_counter() - start, prepare_time)
+    except Exception as e:
+        return Outcome(False, None, time.perf_counter() - start, prepare_time, _describe_error(e))
+
+def _describe_error(error: Exception) -> str:
+    """Comparable form of an error: its type and innermost message"""
+    # Drop the "Evaluation error at <node>: " context added at each level,
+    # which shows the AST as rewritten by each engine
+    message = str(error).rsplit("Evaluation error at ", 1)[-1]
+    if message != str(error):
+        message = message.partition(": ")[2]
+    return f"{type(error).__name__}: {message}"
+
+def _is_resource_error(outcome: Outcome) -> bool:
+    """Engines take different numbers of steps, so resource limits may trip in only some"""
+    return outcome.error is not None and outcome.error.startswith("EvaluationError") and (
+        "limit" in outcome.error or "timeout" in outcome.error)
+
+def _normalize(value: Any) -> Any:
+    """Comparable form of a result"""
+    if isinstance(value, (Function, Builtin)) or callable(value):
+        return "<function>"
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    # repr keeps 1, 1.0 and True apart and makes nan equal to itself
+    return repr(value)
+
+def diverges(reference: Outcome, outcome: Outcome, engine: Engine) -> bool:
+    """True if an engine's outcome is not allowed given the reference outcome"""
+    if _is_resource_error(reference) or _is_resource_error(outcome):
+        return False
+    if reference.ok:
+        return not outcome.ok or outcome.value != reference.value
+    # Lazy evaluation may skip a failing expression that is never used, and
+    # then fail on a later one
+    if engine.lazy:
+        return False
+    return outcome.ok or outcome.error != reference.error
+
+def program_size(program: TypeList[Node]) -> int:
+    return sum(_size(node) for node in program)
+
+def _size(node: Node) -> int:
+    return 1 + sum(_size(child) for child in _child_nodes(node))
+
+def _child_nodes(node: Node):
+    for f in fields(node):
+        if not f.compare:
+            continue
+        value = getattr(node, f.name)
+        if isinstance(value, Node):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, Node):
+                    yield item
+
+def _with_field(node: Node, name: str, value: Any) -> Node:
+    if isinstance(node, (FunctionDef, Lambda)):
+        return replace(node, **{name: value, "free_vars": None})
+    return replace(node, **{name: value})
+
+def _reductions(node: Node):
+    """Yield variants of a node that are one step smaller"""
+    for child in _child_nodes(node):
+        yield child
+    if not isinstance(node, Number) or node.value != 0:
+        yield Number(0)
+    for f in fields(node):
+        if not f.compare:
+            continue
+        value = getattr(node, f.name)
+        if isinstance(value, Node):
+            for smaller in _reductions(value):
+                yield _with_field(node, f.name, smaller)
+        elif isinstance(value, list) and any(isinstance(item, Node) for item in value):
+            for i, item in enumerate(value):
+                # Dropping elements is only safe for list literals
+                if isinstance(node, List):
+                    yield _with_field(node, f.name, value[:i] + value[i + 1:])
+                for smaller in _reductions(item):
+                    yield _with_field(node, f.name, value[:i] + [smaller] + value[i + 1:])
+
+def shrink(program: TypeList[Node], predicate: Callable[[TypeList[Node]], bool],
+           max_attempts: int = 2000) -> TypeList[Node]:
+    """Greedily reduce a program while the predicate keeps holding"""
+    attempts = 0
+    improved = True
+    while improved and attempts < max_attempts:
+        improved = False
+        for candidate in _program_reductions(program):
+            attempts += 1
+            if attempts >= max_attempts:
+                break
+            if program_size(candidate) < program_size(program) and predicate(candidate):
+                program = candidate
+                improved = True
+                break
+    return program
+
+def _program_reductions(program: TypeList[Node]):
+    if len(program) > 1:
+        for i in range(len(program)):
+            yield program[:i] + program[i + 1:]
+    for i, node in enumerate(program):
+        for smaller in _reductions(node):
+            yield program[:i] + [smaller] + program[i + 1:]
+
+class DifferentialFuzzer:
+    """
+    Run generated programs through every engine. Each program runs in the
+    given numeric mode, or in a randomly chosen one if numeric is None.
+    """
+    def __init__(self, seed: int = 0, engines: Optional[TypeList[Engine]] = None,
+                 max_depth: int = 4, outlier_factor: float = 20.0, outlier_min_time: float = 0.005,
+                 limits: Optional[ExecutionLimits] = None, numeric: Optional[str] = None):
+        self.rng = random.Random(seed)
+        self.generator = ProgramGenerator(self.rng, max_depth)
+        self.engines = engines or ENGINES
+        self.numeric = numeric
+        self.outlier_factor = outlier_factor
+        self.outlier_min_time = outlier_min_time
+        self.limits = limits or ExecutionLimits(max_steps=100000, max_cells=100000, timeout=5)
+
+    def run(self, count: int) -> FuzzReport:
+        report = FuzzReport(timings={engine.name: 0.0 for engine in self.engines},
+                            prepare_timings={engine.name: 0.0 for engine in self.engines})
+        reference_engine = self.engines[0]
+        for _ in range(count):
+            numeric = self.numeric or self.rng.choice(NUMERIC_MODES)
+            program = self.generator.program(numeric)
+            report.programs += 1
+            reference = run_engine(reference_engine, program, self.limits, numeric)
+            report.timings[reference_engine.name] += reference.elapsed
+            report.prepare_timings[reference_engine.name] += reference.prepare_time
+            for engine in self.engines[1:]:
+                outcome = run_engine(engine, program, self.limits, numeric)
+                report.timings[engine.name] += outcome.elapsed
+                report.prepare_timings[engine.name] += outcome.prepare_time
+                if diverges(reference, outcome, engine):
+                    report.findings.append(self._divergence(engine, program, numeric, reference, outcome))
+                elif (self._is_outlier(reference.elapsed, outcome.elapsed)
+                      and self._still_slow(engine, program, numeric)):
+                    report.findings.append(self._outlier(engine, program, numeric, reference, outcome))
+        return report
+
+    def _is_outlier(self, reference_time: float, engine_time: float) -> bool:
+        return engine_time > self.outlier_min_time and engine_time > reference_time * self.outlier_factor
+
+    def _still_slow(self, engine: Engine, program, numeric: str) -> bool:
+        # Best of three runs, so that a single slow run (e.g. a GC pause) is not reported
+        reference_time = min(run_engine(self.engines[0], program, self.limits, numeric).elapsed
+                             for _ in range(3))
+        engine_time = min(run_engine(engine, program, self.limits, numeric).elapsed for _ in range(3))
+        return self._is_outlier(reference_time, engine_time)
+
+    def _divergence(self, engine: Engine, program, numeric: str,
+                    reference: Outcome, outcome: Outcome) -> Finding:
+        def still_diverges(candidate):
+            return diverges(run_engine(self.engines[0], candidate, self.limits, numeric),
+                            run_engine(engine, candidate, self.limits, numeric), engine)
+
+        small = shrink(program, still_diverges)
+        details = f"reference {_describe(reference)}, {engine.name} {_describe(outcome)}"
+        return Finding("divergence", engine.name, program, to_source(small), details, numeric)
+
+    def _outlier(self, engine: Engine, program, numeric: str,
+                 reference: Outcome, outcome: Outcome) -> Finding:
+        small = shrink(program, lambda candidate: self._still_slow(engine, candidate, numeric),
+                       max_attempts=200)
+        details = f"{engine.name} took {outcome.elapsed:.4f}s, reference {reference.elapsed:.4f}s"
+        return Finding("outlier", engine.name, program, to_source(small), details, numeric)
+
+def _describe(outcome: Outcome) -> str:
+    return f"returned {outcome.value}" if outcome.ok else f"raised {outcome.error}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Differential fuzzing of the FP evaluation engines")
+    parser.add_argument("--count", type=int, default=200, help="Number of programs to generate")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--max-depth", type=int, default=4, help="Maximum expression depth")
+    parser.add_argument("--numeric", choices=NUMERIC_MODES,
+                        help="Numeric mode of every program (default: a random mode per program)")
+    args = parser.parse_args()
+
+    report = DifferentialFuzzer(args.seed, max_depth=args.max_depth, numeric=args.numeric).run(args.count)
+
+    print(f"{report.programs} programs        evaluation     passes")
+    for name, total in report.timings.items():
+        print(f"  {name:10} {total * 1000:9.1f} ms {report.prepare_timings[name] * 1000:7.1f} ms")
+    for finding in report.findings:
+        print(f"\n{finding.kind} in {finding.engine} ({finding.numeric} mode): {finding.details}")
+        print(finding.reproducer)
+    sys.exit(1 if report.findings else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, List, Optional, Tuple
+
+# Name reported for anonymous functions
+ANONYMOUS = "<lambda>"
+
+class _Unevaluated:
+    def __repr__(self) -> str:
+        return "<unevaluated>"
+
+# Passed to on_enter in place of a lazy argument that was not evaluated yet
+UNEVALUATED = _Unevaluated()
+
+class Instrumentation:
+    """
+    Callbacks invoked by the evaluator.
+
+    on_enter(name, args)                   before a user function body runs
+    on_exit(name, result, elapsed)         after it returned
+    on_unwind(name, error, elapsed)        after it raised instead; every on_enter
+                                           is matched by one on_exit or on_unwind
+    on_builtin(name, args, result, elapsed) after a built-in returned
+    on_error(error, stack)                 when evaluation fails; stack is the
+                                           FP call stack where it was raised
+
+    In lazy mode, an argument that has not been evaluated when the function
+    is entered is passed to on_enter as UNEVALUATED; hooks never force it.
+    Elapsed times are in seconds. The registration methods return the
+    callback so they can be used as decorators.
+    """
+    def __init__(self):
+        self.enter_hooks: List[Callable] = []
+        self.exit_hooks: List[Callable] = []
+        self.unwind_hooks: List[Callable] = []
+        self.builtin_hooks: List[Callable] = []
+        self.error_hooks: List[Callable] = []
+
+    def on_enter(self, callback: Callable) -> Callable:
+        self.enter_hooks.append(callback)
+        return callback
+
+    def on_exit(self, callback: Callable) -> Callable:
+        self.exit_hooks.append(callback)
+        return callback
+
+    def on_unwind(self, callback: Callable) -> Callable:
+        self.unwind_hooks.append(callback)
+        return callback
+
+    def on_builtin(self, callback: Callable) -> Callable:
+        self.builtin_hooks.append(callback)
+        return callback
+
+    def on_error(self, callback: Callable) -> Callable:
+        self.error_hooks.append(callback)
+        return callback
+
+    def remove(self, callback: Callable):
+        """Unregister a callback from every hook it was registered for"""
+        for hooks in (self.enter_hooks, self.exit_hooks, self.unwind_hooks,
+                      self.builtin_hooks, self.error_hooks):
+            while callback in hooks:
+                hooks.remove(callback)
+
+    def function_enter(self, name: str, args: list):
+        for callback in self.enter_hooks:
+            callback(name, args)
+
+    def function_exit(self, name: str, result: Any, elapsed: float):
+        for callback in self.exit_hooks:
+            callback(name, result, elapsed)
+
+    def function_unwind(self, name: str, error: BaseException, elapsed: float):
+        for callback in self.unwind_hooks:
+            callback(name, error, elapsed)
+
+    def builtin_call(self, name: str, args: list, result: Any, elapsed: float):
+        for callback in self.builtin_hooks:
+            callback(name, args, result, elapsed)
+
+    def error(self, error: Exception, stack: Tuple[str, ...]):
+        for callback in self.error_hooks:
+            callback(error, stack)
+
+class Sampler:
+    """
+    Periodically record the FP call stack of an interpreter from a timer thread.
+    The evaluator always maintains its call stack, so sampling adds no cost
+    to evaluation beyond the timer thread itself.
+
+        with Sampler(interpreter, interval=0.005) as sampler:
+            interpreter.run(source)
+        sampler.total_counts().most_common(10)
+    """
+    def __init__(self, interpreter, interval: float = 0.01):
+        self.interpreter = interpreter
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="fp-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            evaluator = self.interpreter.evaluator
+            if evaluator is None:
+                continue
+            stack = tuple(evaluator.call_stack)
+            if stack:
+                self.samples[stack] += 1
+
+    def self_counts(self) -> Counter:
+        """Samples per function at the top of the stack"""
+        counts = Counter()
+        for stack, count in self.samples.items():
+            counts[stack[-1]] += count
+        return counts
+
+    def total_counts(self) -> Counter:
+        """Samples per function anywhere on the stack (recursion counted once)"""
+        counts = Counter()
+        for stack, count in self.samples.items():
+            for name in set(stack):
+                counts[name] += count
+        return counts
+
+    def __enter__(self) -> 'Sampler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
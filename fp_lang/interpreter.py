@@ -1,17 +1,37 @@
 import argparse
+import os
 import sys
-from typing import Optional, TextIO
+from typing import Callable, Optional, TextIO
 from .lexer import Lexer
 from .parser import Parser
 from .evaluator import Evaluator
-from .env import Environment
+from .env import Environment, Function
 from .error import FPError
+from .limits import ExecutionLimits, CHECK_INTERVAL
+from .modules import ModuleRegistry
+from .numeric import NUMERIC_MODES, check_mode
+from .optimize import OPTIMIZATION_LEVELS, optimize
+from .instrument import Instrumentation
+from .snapshot import save_snapshot, load_snapshot
+from .aio import Scheduler, default_scheduler
 
 class Interpreter:
-    def __init__(self):
+    def __init__(self, limits: Optional[ExecutionLimits] = None,
+                 registry: Optional[ModuleRegistry] = None, numeric: str = "float",
+                 lazy: bool = False, optimize: int = 0,
+                 instrumentation: Optional[Instrumentation] = None):
         self.env = Environment()
+        self.limits = limits
+        self.registry = registry
+        self.numeric = check_mode(numeric)
+        self.lazy = lazy
+        self.optimize = optimize
+        self.instrumentation = instrumentation
+        # Evaluator of the current (or last) run, read by the Sampler
+        self.evaluator: Optional[Evaluator] = None
 
-    def run(self, source: str) -> str:
+    def run(self, source: str, checkpoint: Optional[Callable[[], None]] = None,
+            checkpoint_interval: int = CHECK_INTERVAL) -> str:
         try:
             # Tokenize the input
             lexer = Lexer(source)
@@ -21,12 +41,15 @@ class Interpreter:
             print("Tokens:", [f"{t.type}({t.value})" for t in tokens])
 
             # Parse tokens into ASTs
-            parser = Parser(tokens)
-            expressions = parser.parse()
+            parser = Parser(tokens, self.numeric)
+            expressions = optimize(parser.parse(), self.optimize)
             
             # Evaluate each expression in sequence
             result = None
-            evaluator = Evaluator(None, self.env)  # Initialize with no AST
+            evaluator = Evaluator(None, self.env, self.limits, self.registry, self.numeric,
+                                  self.lazy, self.instrumentation,
+                                  checkpoint, checkpoint_interval)  # Initialize with no AST
+            self.evaluator = evaluator
             for expr in expressions:
                 evaluator.ast = expr  # Update AST for each expression
                 result = evaluator.evaluate()
@@ -39,7 +62,7 @@ class Interpreter:
             elif isinstance(result, bool):
                 return str(result).lower()
             elif isinstance(result, Function):
-                return f"Function '{result.name if hasattr(result, 'name') else 'anonymous'}' defined"
+                return f"Function '{result.name or 'anonymous'}' defined"
             else:
                 return str(result)
         except FPError as e:
@@ -47,9 +70,26 @@ class Interpreter:
         except Exception as e:
             return f"Internal error: {str(e)}"
 
-def run_repl():
+    async def run_async(self, source: str, scheduler: Optional[Scheduler] = None) -> str:
+        """
+        Run source from asyncio code, yielding to the event loop between slices
+        of evaluation steps. Tasks sharing a scheduler (by default, one per
+        event loop) take turns fairly.
+        """
+        scheduler = scheduler or default_scheduler()
+        return await scheduler.run(self, source)
+
+    def save_snapshot(self, path: str):
+        """Save the global definitions (and loaded modules) to a snapshot file"""
+        save_snapshot(self.env, path, self.numeric)
+
+    def load_snapshot(self, path: str):
+        """Replace the global environment with one restored from a snapshot file"""
+        self.env = load_snapshot(path, self.registry, self.numeric)
+
+def run_repl(interpreter: Optional[Interpreter] = None):
     """Run an interactive REPL (Read-Eval-Print Loop)"""
-    interpreter = Interpreter()
+    interpreter = interpreter or Interpreter()
     print("FP Language REPL (Ctrl+C to exit)")
     
     while True:
@@ -70,15 +110,18 @@ def run_repl():
             print("\nGoodbye!")
             break
 
-def run_file(file_path: str):
-    """Run a source file"""
+def run_file(file_path: str, interpreter: Optional[Interpreter] = None,
+             snapshot_path: Optional[str] = None):
+    """Run a source file, optionally saving the resulting definitions to a snapshot"""
     try:
         with open(file_path, 'r') as f:
             source = f.read()
         
-        interpreter = Interpreter()
+        interpreter = interpreter or Interpreter()
         result = interpreter.run(source)
         print(result)
+        if snapshot_path:
+            interpreter.save_snapshot(snapshot_path)
 
     except FileNotFoundError:
         print(f"Error: Could not find file '{file_path}'")
@@ -90,12 +133,48 @@ def run_file(file_path: str):
 def main():
     parser = argparse.ArgumentParser(description="FP Language Interpreter")
     parser.add_argument("file", nargs="?", help="Path to source file")
+    parser.add_argument("--max-steps", type=int, help="Maximum number of evaluation steps")
+    parser.add_argument("--max-depth", type=int, help="Maximum function call depth")
+    parser.add_argument("--max-cells", type=int, help="Maximum number of allocated list cells")
+    parser.add_argument("--timeout", type=float, help="Wall-clock timeout in seconds")
+    parser.add_argument("--module-path", action="append", default=[],
+                        help="Directory searched for imported modules (repeatable)")
+    parser.add_argument("--numeric", choices=NUMERIC_MODES, default="float",
+                        help="Representation of non-integer numbers")
+    parser.add_argument("--lazy", action="store_true",
+                        help="Evaluate let values and arguments only when needed")
+    parser.add_argument("-O", "--optimize", type=int, choices=OPTIMIZATION_LEVELS, default=0,
+                        help="Optimization level (1: hash-consing, 2: also common subexpressions)")
+    parser.add_argument("--load-snapshot", metavar="PATH",
+                        help="Start from the definitions saved in a snapshot file")
+    parser.add_argument("--save-snapshot", metavar="PATH",
+                        help="Save the definitions to a snapshot file after running the source file")
     args = parser.parse_args()
 
+    limits = ExecutionLimits(
+        max_steps=args.max_steps,
+        max_depth=args.max_depth,
+        max_cells=args.max_cells,
+        timeout=args.timeout,
+    )
+
+    # Modules are looked up next to the script (or in the current
+    # directory for the REPL) before the --module-path directories
+    script_dir = os.path.dirname(os.path.abspath(args.file)) if args.file else "."
+    registry = ModuleRegistry([script_dir] + args.module_path, args.numeric)
+
+    interpreter = Interpreter(limits, registry, args.numeric, args.lazy, args.optimize)
+    if args.load_snapshot:
+        try:
+            interpreter.load_snapshot(args.load_snapshot)
+        except (OSError, FPError) as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
+
     if args.file:
-        run_file(args.file)
+        run_file(args.file, interpreter, args.save_snapshot)
     else:
-        run_repl()
+        run_repl(interpreter)
 
 if __name__ == "__main__":
     main()
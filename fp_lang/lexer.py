@@ -11,10 +11,14 @@ class TokenType(Enum):
     ELSE = "ELSE"
     TRUE = "TRUE"
     FALSE = "FALSE"
+    IMPORT = "IMPORT"
+    FN = "FN"
     PLUS = "PLUS"
     MINUS = "MINUS"
     MULTIPLY = "MULTIPLY"
     DIVIDE = "DIVIDE"
+    DIV = "DIV"
+    MOD = "MOD"
     GT = "GT"
     LT = "LT"
     EQ = "EQ"
@@ -25,6 +29,7 @@ class TokenType(Enum):
     LBRACE = "LBRACE"
     RBRACE = "RBRACE"
     COMMA = "COMMA"
+    DOT = "DOT"
     EOF = "EOF"
 
 @dataclass
@@ -33,6 +38,7 @@ class Token:
     value: str
     line: int
     column: int
+    spaced: bool = False  # preceded by whitespace or a comment
 
 class Lexer:
     def __init__(self, source: str):
@@ -72,7 +78,14 @@ class Lexer:
         while self.current_char and self.current_char.isdigit():
             result += self.current_char
             self.advance()
-        return int(result)
+        # Fractional part, only when a digit follows the dot
+        if self.current_char == '.' and self.peek() and self.peek().isdigit():
+            result += self.current_char
+            self.advance()
+            while self.current_char and self.current_char.isdigit():
+                result += self.current_char
+                self.advance()
+        return result
 
     def identifier(self):
         result = ''
@@ -98,7 +111,7 @@ class Lexer:
                     return Token(TokenType.DIVIDE, '/', self.line, self.column)
 
             if self.current_char.isdigit():
-                return Token(TokenType.NUMBER, str(self.number()), self.line, self.column)
+                return Token(TokenType.NUMBER, self.number(), self.line, self.column)
 
             if self.current_char.isalpha():
                 identifier = self.identifier()
@@ -116,6 +129,14 @@ class Lexer:
                     return Token(TokenType.TRUE, identifier, self.line, self.column)
                 elif identifier == 'false':
                     return Token(TokenType.FALSE, identifier, self.line, self.column)
+                elif identifier == 'div':
+                    return Token(TokenType.DIV, identifier, self.line, self.column)
+                elif identifier == 'mod':
+                    return Token(TokenType.MOD, identifier, self.line, self.column)
+                elif identifier == 'import':
+                    return Token(TokenType.IMPORT, identifier, self.line, self.column)
+                elif identifier == 'fn':
+                    return Token(TokenType.FN, identifier, self.line, self.column)
                 return Token(TokenType.IDENTIFIER, identifier, self.line, self.column)
 
             if self.current_char == '+':
@@ -162,6 +183,10 @@ class Lexer:
                 self.advance()
                 return Token(TokenType.COMMA, ',', self.line, self.column)
 
+            if self.current_char == '.':
+                self.advance()
+                return Token(TokenType.DOT, '.', self.line, self.column)
+
             if self.current_char == '>':
                 self.advance()
                 return Token(TokenType.GT, '>', self.line, self.column)
@@ -187,7 +212,11 @@ class Lexer:
     def tokenize(self):
         tokens = []
         while True:
+            start = self.pos
             token = self.get_next_token()
+            # Whitespace or a comment was skipped before the token
+            token.spaced = start < len(self.source) and (
+                self.source[start].isspace() or self.source.startswith('//', start))
             tokens.append(token)
             if token.type == TokenType.EOF:
                 break
@@ -0,0 +1,26 @@
+from dataclasses import dataclass
+from typing import Optional
+
+# Number of evaluation steps between two checks of the step budget and
+# the wall-clock deadline
+CHECK_INTERVAL = 1024
+
+# Python frames allowed per nested user function call when the recursion
+# limit is raised to fit max_depth (a plain call uses about 5)
+FRAMES_PER_CALL = 8
+# The Python recursion limit is never raised beyond this many frames
+MAX_RECURSION_LIMIT = 100000
+
+@dataclass
+class ExecutionLimits:
+    """
+    Resource limits enforced by the evaluator.
+    A limit set to None is not enforced. A call depth limit raises Python's
+    recursion limit (process-wide, never lowered) so that the limit can be
+    reached; depths beyond about MAX_RECURSION_LIMIT / FRAMES_PER_CALL still
+    fail with "maximum recursion depth exceeded".
+    """
+    max_steps: Optional[int] = None     # evaluated AST nodes
+    max_depth: Optional[int] = None     # nested user function calls
+    max_cells: Optional[int] = None     # list cells allocated
+    timeout: Optional[float] = None     # wall-clock seconds
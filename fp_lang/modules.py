@@ -0,0 +1,125 @@
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+from .env import Environment
+from .error import EvaluationError
+
+MODULE_EXTENSION = ".fp"
+
+class Module:
+    """
+    Handle bound to a name by an import.
+    The module is only loaded when one of its members is first accessed.
+    """
+    def __init__(self, name: str, registry: 'ModuleRegistry'):
+        self.name = name
+        self.registry = registry
+        self._env: Optional[Environment] = None
+
+    @property
+    def env(self) -> Environment:
+        return self.load()
+
+    def load(self, evaluator=None) -> Environment:
+        """Return the module's environment, loading it with the given evaluator if needed"""
+        if self._env is None:
+            self._env = self.registry.load(self.name, evaluator)
+        return self._env
+
+    def get(self, member: str, evaluator=None):
+        """Get a top-level definition of the module"""
+        env = self.load(evaluator)
+        if member not in env.values:
+            raise NameError(f"Module '{self.name}' has no member '{member}'")
+        return env.values[member]
+
+    def __repr__(self) -> str:
+        return f"<module '{self.name}'>"
+
+class ModuleRegistry:
+    """
+    Process-wide cache of evaluated modules.
+    Each module is parsed and evaluated once per numeric mode; its top-level
+    environment is then shared by every interpreter using the registry.
+    """
+    def __init__(self, search_path: Optional[Sequence[str]] = None, numeric: str = "float"):
+        self.search_path: List[str] = list(search_path) if search_path is not None else ["."]
+        self.numeric = numeric
+        # Evaluated modules by (name, numeric mode)
+        self._modules: Dict[Tuple[str, str], Environment] = {}
+        self._loading: set = set()
+        self._lock = threading.RLock()
+
+    def find(self, name: str) -> str:
+        """Return the path of the source file for a module"""
+        for directory in self.search_path:
+            path = os.path.join(directory, name + MODULE_EXTENSION)
+            if os.path.isfile(path):
+                return path
+        raise EvaluationError(f"Module '{name}' not found")
+
+    def load(self, name: str, evaluator=None, numeric: Optional[str] = None) -> Environment:
+        """
+        Return the evaluated top-level environment of a module, loading it if
+        needed. The module is evaluated by the given evaluator (normally the
+        one of the importing program), so its limits and hooks apply, and in
+        that evaluator's numeric mode. Without an evaluator, numeric selects
+        the mode (the registry's by default). Each mode has its own copy of a
+        module.
+        """
+        if evaluator is not None:
+            numeric = evaluator.numeric
+        numeric = numeric or self.numeric
+        key = (name, numeric)
+        env = self._modules.get(key)
+        if env is not None:
+            return env
+
+        with self._lock:
+            if key in self._modules:
+                return self._modules[key]
+            if key in self._loading:
+                raise EvaluationError(f"Circular import of module '{name}'")
+
+            self._loading.add(key)
+            try:
+                env = self._evaluate(self.find(name), numeric, evaluator)
+            finally:
+                self._loading.discard(key)
+            self._modules[key] = env
+            return env
+
+    def add(self, name: str, env: Environment, numeric: Optional[str] = None):
+        """Register an already evaluated module, unless one of that name is loaded"""
+        with self._lock:
+            self._modules.setdefault((name, numeric or self.numeric), env)
+
+    def _evaluate(self, path: str, numeric: str, evaluator=None) -> Environment:
+        # Imported here to avoid a circular import with the evaluator
+        from .lexer import Lexer
+        from .parser import Parser
+        from .evaluator import Evaluator
+
+        with open(path, 'r') as f:
+            source = f.read()
+
+        env = Environment()
+        if evaluator is None:
+            evaluator = Evaluator(None, env, registry=self, numeric=numeric)
+        # The registry lock is held, so a cooperative task must not pause here:
+        # another task waiting for the lock could never reach its own checkpoint
+        interruptible, evaluator.interruptible = evaluator.interruptible, False
+        try:
+            for expr in Parser(Lexer(source).tokenize(), numeric).parse():
+                evaluator._eval(expr, env)
+        finally:
+            evaluator.interruptible = interruptible
+        return env
+
+    def clear(self):
+        """Drop all cached modules"""
+        with self._lock:
+            self._modules.clear()
+
+# Registry shared by all interpreters of the process unless one is given explicitly
+default_registry = ModuleRegistry()
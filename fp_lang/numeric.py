@@ -0,0 +1,52 @@
+from decimal import Decimal
+from fractions import Fraction
+from typing import Union
+
+# How non-integer literals and '/' are represented:
+#   float    - binary floating point (default)
+#   rational - exact fractions
+#   decimal  - decimal floating point, exact for decimal literals
+NUMERIC_MODES = ("float", "rational", "decimal")
+
+Numeric = Union[int, float, Fraction, Decimal]
+
+def check_mode(mode: str) -> str:
+    if mode not in NUMERIC_MODES:
+        raise ValueError(f"Unknown numeric mode '{mode}', expected one of {', '.join(NUMERIC_MODES)}")
+    return mode
+
+def parse_number(text: str, mode: str = "float") -> Numeric:
+    """Convert a numeric literal to a value of the given numeric mode"""
+    if '.' not in text:
+        return int(text)
+    if mode == "rational":
+        return Fraction(text)
+    if mode == "decimal":
+        return Decimal(text)
+    return float(text)
+
+def divide(left: Numeric, right: Numeric, mode: str = "float") -> Numeric:
+    """Exact or floating point division, depending on the numeric mode"""
+    if mode == "rational" and not isinstance(left, float) and not isinstance(right, float):
+        return Fraction(left) / right
+    if mode == "decimal" and isinstance(left, int) and isinstance(right, int):
+        return Decimal(left) / right
+    return left / right
+
+def _floor_divmod(left: Numeric, right: Numeric):
+    if isinstance(left, Decimal) or isinstance(right, Decimal):
+        # Decimal // and % truncate toward zero; adjust to floor like the other types
+        quotient, remainder = left // right, left % right
+        if remainder != 0 and (remainder < 0) != (right < 0):
+            quotient -= 1
+            remainder += right
+        return quotient, remainder
+    return left // right, left % right
+
+def floor_div(left: Numeric, right: Numeric) -> Numeric:
+    """Division rounded toward negative infinity ('div')"""
+    return _floor_divmod(left, right)[0]
+
+def modulo(left: Numeric, right: Numeric) -> Numeric:
+    """Remainder of floor division, with the sign of the divisor ('mod')"""
+    return _floor_divmod(left, right)[1]
@@ -0,0 +1,219 @@
+from dataclasses import fields, replace
+from typing import Dict, List as TypeList, Tuple
+from .ast_nodes import *
+from .analysis import free_variables
+
+# Optimization levels:
+#   0 - none
+#   1 - hash-consing: structurally identical subtrees share one node
+#   2 - hash-consing and common-subexpression elimination in function bodies
+OPTIMIZATION_LEVELS = (0, 1, 2)
+
+def _children(node: Node):
+    """Yield (field name, value) for the fields that take part in equality"""
+    for f in fields(node):
+        if f.compare:
+            yield f.name, getattr(node, f.name)
+
+def _map_children(node: Node, function) -> Node:
+    """Rebuild a node with function applied to its child nodes; unchanged nodes are reused"""
+    changes = {}
+    for name, value in _children(node):
+        if isinstance(value, Node):
+            new_value = function(value)
+            if new_value is not value:
+                changes[name] = new_value
+        elif isinstance(value, list) and any(isinstance(item, Node) for item in value):
+            new_value = [function(item) if isinstance(item, Node) else item for item in value]
+            if any(new is not old for new, old in zip(new_value, value)):
+                changes[name] = new_value
+    if not changes:
+        return node
+    if isinstance(node, (FunctionDef, Lambda)):
+        changes["free_vars"] = None
+    return replace(node, **changes)
+
+class HashConser:
+    """
+    Intern AST nodes so that structurally identical subtrees are represented
+    by a single shared node.
+    """
+    def __init__(self):
+        self._table: Dict[Tuple, Node] = {}
+
+    def intern(self, node: Node) -> Node:
+        node = _map_children(node, self.intern)
+        key = self._key(node)
+        shared = self._table.get(key)
+        if shared is None:
+            shared = self._table[key] = node
+        return shared
+
+    def _key(self, node: Node) -> Tuple:
+        parts = [type(node)]
+        for name, value in _children(node):
+            if isinstance(value, Node):
+                # Children are already interned, so identity is structure
+                parts.append(id(value))
+            elif isinstance(value, list):
+                parts.append(tuple(id(item) if isinstance(item, Node) else item for item in value))
+            else:
+                # Keep 1, 1.0 and True apart, and Decimal 1.0 and 1.00 (equal but
+                # printed differently)
+                parts.append((type(value), repr(value)))
+        return tuple(parts)
+
+class CommonSubexpressionEliminator:
+    """
+    Evaluate repeated pure subexpressions of a function body once per scope.
+
+    Repeated occurrences of a hash-consed subtree are replaced by one CSERef
+    whose value is cached in a hidden slot. The slot lives in the scope that
+    binds the innermost of the subexpression's free variables (the function
+    call or a let body), which is wrapped in a CSEScope defining it. Values
+    are computed on first use, so evaluation order and errors are unchanged.
+    Nested functions are optimized as scopes of their own.
+    """
+    def __init__(self):
+        self._slot_counter = 0
+        self._scopes: Dict[int, Node] = {}
+        self._free: Dict[int, frozenset] = {}
+        self._pure: Dict[int, bool] = {}
+
+    def run(self, node: Node) -> Node:
+        result = self._scopes.get(id(node))
+        if result is None:
+            if isinstance(node, (FunctionDef, Lambda)):
+                body = self._eliminate(node.params, self.run(node.body))
+                result = replace(node, body=body, free_vars=None) if body is not node.body else node
+            else:
+                result = _map_children(node, self.run)
+            self._scopes[id(node)] = result
+        return result
+
+    def _free_variables(self, node: Node) -> frozenset:
+        result = self._free.get(id(node))
+        if result is None:
+            result = self._free[id(node)] = free_variables(node)
+        return result
+
+    def _is_pure(self, node: Node) -> bool:
+        """True if evaluating the node has no effect on the environment"""
+        result = self._pure.get(id(node))
+        if result is None:
+            if isinstance(node, (FunctionDef, Import)):
+                result = False
+            elif isinstance(node, Lambda):
+                result = True
+            else:
+                result = all(self._is_pure(child) for child in _child_nodes(node))
+            self._pure[id(node)] = result
+        return result
+
+    def _is_candidate(self, node: Node) -> bool:
+        if isinstance(node, (Number, Identifier, QualifiedName, Lambda, FunctionDef, Import)):
+            return False
+        return self._is_pure(node)
+
+    def _eliminate(self, params: TypeList[str], body: Node) -> Node:
+        # Scopes are identified by the let node binding them, or 0 for the function call
+        counts: Dict[Tuple[int, int], int] = {}
+        self._count(body, [(0, set(params))], counts)
+
+        slots: Dict[Tuple[int, int], str] = {}
+        scope_slots: Dict[int, TypeList[str]] = {}
+        for key, count in counts.items():
+            if count > 1:
+                slot = f"#cse{self._slot_counter}"
+                self._slot_counter += 1
+                slots[key] = slot
+                scope_slots.setdefault(key[1], []).append(slot)
+        if not slots:
+            return body
+
+        refs: Dict[Tuple[int, int], CSERef] = {}
+        body = self._rewrite(body, [(0, set(params))], slots, scope_slots, refs)
+        if 0 in scope_slots:
+            body = CSEScope(scope_slots[0], body)
+        return body
+
+    def _binder(self, node: Node, stack) -> int:
+        """The innermost scope binding any free variable of the node"""
+        names = self._free_variables(node)
+        for binder, bound in reversed(stack):
+            if bound & names:
+                return binder
+        return 0
+
+    def _count(self, node: Node, stack, counts):
+        """
+        Count how often each candidate is evaluated along a single execution
+        path: branches of an if are counted separately and merged by maximum.
+        Occurrences inside a repeated candidate are only counted once.
+        """
+        if isinstance(node, (FunctionDef, Lambda)):
+            return
+        if self._is_candidate(node):
+            key = (id(node), self._binder(node, stack))
+            counts[key] = counts.get(key, 0) + 1
+            if counts[key] > 1:
+                return
+        if isinstance(node, LetBinding):
+            self._count(node.value, stack, counts)
+            self._count(node.body, stack + [(id(node), {node.name})], counts)
+        elif isinstance(node, IfExpr):
+            self._count(node.condition, stack, counts)
+            then_counts = dict(counts)
+            self._count(node.then_branch, stack, then_counts)
+            self._count(node.else_branch, stack, counts)
+            for key, count in then_counts.items():
+                if count > counts.get(key, 0):
+                    counts[key] = count
+        else:
+            for child in _child_nodes(node):
+                self._count(child, stack, counts)
+
+    def _rewrite(self, node: Node, stack, slots, scope_slots, refs) -> Node:
+        if isinstance(node, (FunctionDef, Lambda)):
+            return node
+        if self._is_candidate(node):
+            key = (id(node), self._binder(node, stack))
+            if key in refs:
+                return refs[key]
+            if key in slots:
+                expr = self._rewrite_children(node, stack, slots, scope_slots, refs)
+                ref = refs[key] = CSERef(slots[key], expr)
+                return ref
+        return self._rewrite_children(node, stack, slots, scope_slots, refs)
+
+    def _rewrite_children(self, node: Node, stack, slots, scope_slots, refs) -> Node:
+        if isinstance(node, LetBinding):
+            value = self._rewrite(node.value, stack, slots, scope_slots, refs)
+            body = self._rewrite(node.body, stack + [(id(node), {node.name})], slots, scope_slots, refs)
+            if id(node) in scope_slots:
+                body = CSEScope(scope_slots[id(node)], body)
+            if value is node.value and body is node.body:
+                return node
+            return LetBinding(node.name, value, body)
+        return _map_children(node, lambda child: self._rewrite(child, stack, slots, scope_slots, refs))
+
+def _child_nodes(node: Node):
+    for name, value in _children(node):
+        if isinstance(value, Node):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, Node):
+                    yield item
+
+def optimize(expressions: TypeList[Node], level: int = 0) -> TypeList[Node]:
+    """Apply the optimizations of the given level to parsed expressions"""
+    if level not in OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown optimization level {level}")
+    if level >= 1:
+        conser = HashConser()
+        expressions = [conser.intern(expr) for expr in expressions]
+    if level >= 2:
+        eliminator = CommonSubexpressionEliminator()
+        expressions = [eliminator.run(expr) for expr in expressions]
+    return expressions
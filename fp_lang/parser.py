@@ -2,11 +2,13 @@ from typing import Optional, Sequence
 from typing import List as TypeList
 from .lexer import Token, TokenType
 from .ast_nodes import *
+from .numeric import parse_number, check_mode
 
 class Parser:
-    def __init__(self, tokens: Sequence[Token]):
+    def __init__(self, tokens: Sequence[Token], numeric: str = "float"):
         self.tokens = tokens
         self.current = 0
+        self.numeric = check_mode(numeric)
 
     def error(self, message: str):
         token = self.current_token()
@@ -47,8 +49,51 @@ class Parser:
             return self.if_expression()
         elif self.current_token().type == TokenType.LBRACE:
             return self.block_expression()
+        elif self.current_token().type == TokenType.IMPORT:
+            return self.import_statement()
+        elif self.current_token().type == TokenType.FN:
+            return self.lambda_expression()
         return self.comparison()
 
+    def parameters(self) -> TypeList[str]:
+        """Parse a parenthesized list of parameter names"""
+        self.consume(TokenType.LPAREN, "Expected '('")
+        params = []
+        while self.current_token().type != TokenType.RPAREN:
+            if self.current_token().type != TokenType.IDENTIFIER:
+                self.error("Expected parameter name")
+            params.append(self.current_token().value)
+            self.advance()
+            if self.current_token().type == TokenType.COMMA:
+                self.advance()
+        self.consume(TokenType.RPAREN, "Expected ')'")
+        return params
+
+    def arguments(self) -> TypeList[Node]:
+        """Parse call arguments up to and including the closing ')'"""
+        args = []
+        while self.current_token().type != TokenType.RPAREN:
+            args.append(self.expression())
+            if self.current_token().type == TokenType.COMMA:
+                self.advance()
+        self.consume(TokenType.RPAREN, "Expected ')'")
+        return args
+
+    def lambda_expression(self) -> Node:
+        self.consume(TokenType.FN, "Expected 'fn'")
+        params = self.parameters()
+        self.consume(TokenType.EQ, "Expected '='")
+        body = self.expression()
+        return Lambda(params, body)
+
+    def import_statement(self) -> Node:
+        self.consume(TokenType.IMPORT, "Expected 'import'")
+        if self.current_token().type != TokenType.IDENTIFIER:
+            self.error("Expected module name after 'import'")
+        module = self.current_token().value
+        self.advance()
+        return Import(module)
+
     def block_expression(self) -> Node:
         """Parse a block of expressions enclosed in curly braces"""
         self.consume(TokenType.LBRACE, "Expected '{'")
@@ -71,16 +116,7 @@ class Parser:
         name = self.current_token().value
         self.advance()
 
-        self.consume(TokenType.LPAREN, "Expected '('")
-        params = []
-        while self.current_token().type != TokenType.RPAREN:
-            if self.current_token().type != TokenType.IDENTIFIER:
-                self.error("Expected parameter name")
-            params.append(self.current_token().value)
-            self.advance()
-            if self.current_token().type == TokenType.COMMA:
-                self.advance()
-        self.consume(TokenType.RPAREN, "Expected ')'")
+        params = self.parameters()
         
         self.consume(TokenType.EQ, "Expected '='")
         body = self.expression()
@@ -160,22 +196,33 @@ class Parser:
         return node
 
     def factor(self) -> Node:
-        node = self.primary()
+        node = self.call()
         
-        while self.current_token().type in [TokenType.MULTIPLY, TokenType.DIVIDE]:
+        while self.current_token().type in [TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.DIV, TokenType.MOD]:
             op = self.current_token().value
             self.advance()
-            right = self.primary()
+            right = self.call()
             node = BinaryOp(node, op, right)
             
         return node
 
+    def call(self) -> Node:
+        node = self.primary()
+
+        # Apply the value of an expression, e.g. f(1)(2) or (fn(x) = x)(1).
+        # A '(' after whitespace starts a new expression instead.
+        while self.current_token().type == TokenType.LPAREN and not self.current_token().spaced:
+            self.advance()
+            node = Apply(node, self.arguments())
+
+        return node
+
     def primary(self) -> Node:
         token = self.current_token()
         
         if token.type == TokenType.NUMBER:
             self.advance()
-            return Number(int(token.value))
+            return Number(parse_number(token.value, self.numeric))
         elif token.type == TokenType.TRUE:
             self.advance()
             return Number(1)  # Represent true as 1
@@ -185,16 +232,22 @@ class Parser:
             
         elif token.type == TokenType.IDENTIFIER:
             self.advance()
+            module = None
+            name = token.value
+            # Qualified access to a member of an imported module
+            if self.current_token().type == TokenType.DOT:
+                self.advance()
+                if self.current_token().type != TokenType.IDENTIFIER:
+                    self.error("Expected name after '.'")
+                module = name
+                name = self.current_token().value
+                self.advance()
             if self.current_token().type == TokenType.LPAREN:
                 self.advance()
-                args = []
-                while self.current_token().type != TokenType.RPAREN:
-                    args.append(self.expression())
-                    if self.current_token().type == TokenType.COMMA:
-                        self.advance()
-                self.consume(TokenType.RPAREN, "Expected ')'")
-                return FunctionCall(token.value, args)
-            return Identifier(token.value)
+                return FunctionCall(name, self.arguments(), module)
+            if module is not None:
+                return QualifiedName(module, name)
+            return Identifier(name)
             
         elif token.type == TokenType.LBRACKET:
             self.advance()
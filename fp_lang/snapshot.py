@@ -0,0 +1,161 @@
+"""
+Snapshots of a warmed-up global environment.
+
+A snapshot holds the user definitions of a global environment (functions,
+their closures and the constants they captured) together with the
+environments of the modules it imports, so a new process can restore a
+prelude without re-parsing and re-evaluating it.
+
+File layout: the MAGIC bytes, a version byte, a byte for the numeric mode
+the definitions were evaluated in, then a pickle (protocol 5) of the
+environments. Built-ins are only referenced by name, and module
+handles are re-bound to the restoring registry. Pending lazy values are
+forced before saving. Restoring only accepts interpreter classes and reads
+the file through a memory map where the platform allows it.
+"""
+import mmap
+import pickle
+import types
+from typing import Dict, Optional
+from .env import Environment, Thunk
+from .error import FPError, EvaluationError
+from .modules import Module, ModuleRegistry, default_registry
+from .numeric import NUMERIC_MODES, check_mode
+
+MAGIC = b"FPSNAP"
+VERSION = 2
+_HEADER = MAGIC + bytes([VERSION])
+
+# The only globals a snapshot may refer to, as exact (module, name) pairs
+_AST_CLASSES = ("Number", "Identifier", "BinaryOp", "FunctionDef", "FunctionCall", "Lambda",
+                "Apply", "IfExpr", "LetBinding", "Import", "QualifiedName", "CSEScope",
+                "CSERef", "List", "Head", "Tail", "Length", "Concat")
+_ALLOWED_GLOBALS = frozenset(
+    [("fp_lang.ast_nodes", name) for name in _AST_CLASSES] + [
+        ("fp_lang.env", "Environment"),
+        ("fp_lang.env", "Function"),
+        ("fp_lang.env", "Builtin"),
+        ("fp_lang.snapshot", "_forced"),
+        ("builtins", "frozenset"),
+        ("builtins", "set"),
+        ("fractions", "Fraction"),
+        ("decimal", "Decimal"),
+    ])
+
+def _forced(value):
+    """Stands in for a thunk whose value was computed while saving"""
+    return value
+
+class _SnapshotPickler(pickle.Pickler):
+    def __init__(self, file, numeric: str):
+        super().__init__(file, protocol=5)
+        self.numeric = numeric
+        # Environments of the modules reached while pickling, by name
+        self.modules: Dict[str, Environment] = {}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Module):
+            if obj.name not in self.modules:
+                try:
+                    self.modules[obj.name] = obj.registry.load(obj.name, numeric=self.numeric)
+                except FPError:
+                    # Stored by name only; resolved on first use after restoring
+                    pass
+            return ("module", obj.name)
+        return None
+
+    def reducer_override(self, obj):
+        if isinstance(obj, Thunk):
+            return (_forced, (obj.force(),))
+        if isinstance(obj, types.FunctionType):
+            raise EvaluationError(f"cannot snapshot native function '{obj.__name__}'")
+        return NotImplemented
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, registry: ModuleRegistry):
+        super().__init__(file)
+        self.registry = registry
+
+    def find_class(self, module, name):
+        # Dotted names would let pickle reach attributes of an allowed module
+        if "." not in name and (module, name) in _ALLOWED_GLOBALS:
+            return super().find_class(module, name)
+        raise EvaluationError(f"snapshot refers to disallowed class {module}.{name}")
+
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind == "module":
+            return Module(name, self.registry)
+        raise EvaluationError(f"snapshot refers to unknown {kind} '{name}'")
+
+def save_snapshot(env: Environment, path: str, numeric: str = "float"):
+    """
+    Write the global environment and the modules it imports to a snapshot file.
+    numeric is the mode the environment was evaluated in. Imported modules that
+    were not loaded yet are loaded first, in that mode; modules that cannot be
+    found are stored by name only.
+    """
+    mode = NUMERIC_MODES.index(check_mode(numeric))
+    with open(path, 'wb') as f:
+        f.write(_HEADER + bytes([mode]))
+        pickler = _SnapshotPickler(f, numeric)
+        pickler.dump(env)
+        # Modules reached only from other modules are collected while they are pickled
+        pickled = set()
+        while len(pickled) < len(pickler.modules):
+            pending = {name: module_env for name, module_env in pickler.modules.items()
+                       if name not in pickled}
+            pickler.dump(pending)
+            pickled.update(pending)
+        pickler.dump(None)
+
+def load_snapshot(path: str, registry: Optional[ModuleRegistry] = None,
+                  numeric: Optional[str] = None) -> Environment:
+    """
+    Restore a global environment from a snapshot file. If numeric is given,
+    the snapshot must have been saved in that mode. Modules it contains are
+    added to the registry for the mode they were saved in, unless the
+    registry already has them loaded.
+    """
+    registry = registry or default_registry
+    with open(path, 'rb') as f:
+        try:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Empty files and some file systems cannot be mapped
+            source = f
+        try:
+            if source.read(len(_HEADER)) != _HEADER:
+                raise EvaluationError(f"'{path}' is not a snapshot of this version")
+            mode = source.read(1)
+            if len(mode) != 1 or mode[0] >= len(NUMERIC_MODES):
+                raise EvaluationError(f"corrupt snapshot '{path}'")
+            saved = NUMERIC_MODES[mode[0]]
+            if numeric is not None and numeric != saved:
+                raise EvaluationError(
+                    f"snapshot '{path}' was saved in {saved} mode, not {numeric}")
+            unpickler = _SnapshotUnpickler(source, registry)
+            try:
+                env = unpickler.load()
+                modules: Dict[str, Environment] = {}
+                while True:
+                    batch = unpickler.load()
+                    if batch is None:
+                        break
+                    modules.update(batch)
+            except FPError:
+                raise
+            except Exception as e:
+                # Damaged data can make pickle fail in many ways
+                raise EvaluationError(f"corrupt snapshot '{path}': {type(e).__name__}: {e}")
+        finally:
+            if source is not f:
+                source.close()
+
+    if not isinstance(env, Environment) or not all(
+            isinstance(name, str) and isinstance(module_env, Environment)
+            for name, module_env in modules.items()):
+        raise EvaluationError(f"corrupt snapshot '{path}'")
+    for name, module_env in modules.items():
+        registry.add(name, module_env, saved)
+    return env
@@ -1,9 +1,23 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
 import unittest
+from decimal import Decimal
 from ..lexer import Lexer
 from ..parser import Parser
 from ..evaluator import Evaluator
 from ..env import Environment
 from ..interpreter import Interpreter
+from ..limits import ExecutionLimits
+from ..error import EvaluationError
+from ..modules import ModuleRegistry
+from ..analysis import strict_variables
+from ..optimize import optimize
+from ..instrument import Instrumentation, Sampler, UNEVALUATED
+from ..aio import Scheduler
+from ..fuzz import DifferentialFuzzer, ENGINES, diverges, run_engine, shrink, program_size, to_source
 
 class TestInterpreter(unittest.TestCase):
     def setUp(self):
@@ -21,6 +35,34 @@ class TestInterpreter(unittest.TestCase):
             result = self.interpreter.run(source)
             self.assertEqual(result, expected)
 
+    def test_numeric_literals_and_division(self):
+        tests = [
+            ("1.5 + 1", "2.5"),
+            ("7 div 2", "3"),
+            ("7 mod 2", "1"),
+            ("2.5 * 2", "5.0"),
+        ]
+
+        for source, expected in tests:
+            result = self.interpreter.run(source)
+            self.assertEqual(result, expected)
+
+    def test_numeric_modes(self):
+        rational = Interpreter(numeric="rational")
+        self.assertEqual(rational.run("1 / 3 + 1 / 6"), "1/2")
+        self.assertEqual(rational.run("0.25 * 2"), "1/2")
+
+        decimal = Interpreter(numeric="decimal")
+        self.assertEqual(decimal.run("0.1 + 0.2"), "0.3")
+        self.assertEqual(decimal.run("1 / 4"), "0.25")
+
+        # div and mod floor in every mode
+        for mode in ("float", "rational", "decimal"):
+            interpreter = Interpreter(numeric=mode)
+            self.assertEqual(float(interpreter.run("(0 - 7.0) div 2")), -4.0)
+            self.assertEqual(float(interpreter.run("(0 - 7.0) mod 2")), 1.0)
+            self.assertEqual(float(interpreter.run("7.0 mod (0 - 2)")), -1.0)
+
     def test_comparison(self):
         tests = [
             ("1 < 2", "True"),
@@ -59,6 +101,173 @@ class TestInterpreter(unittest.TestCase):
         result = self.interpreter.run(source)
         self.assertEqual(result, "5")
 
+    def test_lambda_and_partial_application(self):
+        source = """
+        def add(x, y) = x + y
+        def map(f, lst) = if length(lst) = 0 then [] else [f(head(lst))] + map(f, tail(lst))
+        def compose(f, g) = fn(x) = f(g(x))
+        map(compose(add(1), fn(x) = x * 10), [1, 2, 3])
+        """
+        result = self.interpreter.run(source)
+        self.assertEqual(result, "Result: [11, 21, 31]")
+        self.assertEqual(self.interpreter.run("(fn(x) = x * 2)(21)"), "42")
+        self.assertEqual(self.interpreter.run("add(1)(2)"), "3")
+
+    def test_closure_captures_only_free_variables(self):
+        source = """
+        def adder(n) = {
+            let unused = [1, 2, 3]
+            fn(x) = x + n
+        }
+        adder(5)
+        """
+        evaluator = Evaluator(None, Environment())
+        for expr in Parser(Lexer(source).tokenize()).parse():
+            evaluator.ast = expr
+            closure = evaluator.evaluate()
+
+        self.assertEqual(closure.env.values, {"n": 5})
+        self.assertIs(closure.env.parent, evaluator.env)
+
+    def test_lazy_evaluation(self):
+        source = """
+        def first(a, b) = a
+        let unused = head([])
+        first(1, tail([]))
+        """
+        self.assertIn("empty list", self.interpreter.run(source))
+        self.assertEqual(Interpreter(lazy=True).run(source), "1")
+
+        with open('fp_lang/examples/bubble_sort.fp', 'r') as f:
+            source = f.read()
+        result = Interpreter(lazy=True).run(source)
+        self.assertEqual(result, "Result: [11, 12, 22, 25, 34, 64, 90]")
+
+    def test_strictness_analysis(self):
+        def strict(source):
+            return strict_variables(Parser(Lexer(source).tokenize()).parse()[0])
+
+        self.assertEqual(strict("if x > 0 then y else y + z"), {"x", "y"})
+        self.assertEqual(strict("length(lst) + f(a)"), {"length", "lst", "f"})
+        self.assertEqual(strict("let t = a + b\nif c then t else 0"), {"c"})
+        self.assertEqual(strict("let t = a + b\nt * c"), {"a", "b", "c"})
+
+    def test_hash_consing(self):
+        source = "[length(tail(lst)), length(tail(lst))]"
+        expr = optimize(Parser(Lexer(source).tokenize()).parse(), 1)[0]
+        self.assertIs(expr.elements[0], expr.elements[1])
+        # Equal literals that print differently stay distinct
+        self.assertEqual(Interpreter(numeric="decimal", optimize=1).run("[1.0, 1.00, 1]"),
+                         "Result: [1.0, 1.00, 1]")
+
+    def test_common_subexpression_elimination(self):
+        source = """
+        def count(n) = if n < 1 then 0 else 1 + count(n - 1)
+        def twice(n) = count(n) + count(n)
+        twice(50)
+        """
+        steps = {}
+        for level in (0, 2):
+            evaluator = Evaluator(None, Environment())
+            for expr in optimize(Parser(Lexer(source).tokenize()).parse(), level):
+                evaluator.ast = expr
+                result = evaluator.evaluate()
+            self.assertEqual(result, 100)
+            steps[level] = evaluator.steps
+
+        self.assertLess(steps[2], steps[0] * 0.6)
+        self.assertEqual(Interpreter(optimize=2).run(source), "100")
+
+    def test_instrumentation_hooks(self):
+        events = []
+        instrumentation = Instrumentation()
+        instrumentation.on_enter(lambda name, args: events.append(("enter", name, args)))
+        instrumentation.on_exit(lambda name, result, elapsed: events.append(("exit", name, result)))
+        instrumentation.on_builtin(lambda name, args, result, elapsed: events.append(("builtin", name, result)))
+        instrumentation.on_unwind(lambda name, error, elapsed: events.append(("unwind", name)))
+        instrumentation.on_error(lambda error, stack: events.append(("error", stack)))
+        interpreter = Interpreter(instrumentation=instrumentation)
+
+        self.assertEqual(interpreter.run("def inc(x) = x + 1\ninc(length([1, 2]))"), "3")
+        self.assertEqual(events, [("builtin", "length", 2), ("enter", "inc", [2]), ("exit", "inc", 3)])
+
+        events.clear()
+        interpreter.run("def bad(x) = head(x)\ndef outer(y) = bad(y)\nouter([])")
+        self.assertEqual(events[-1], ("error", ("outer", "bad")))
+        # Failing calls are closed by an unwind, innermost first
+        self.assertEqual([event for event in events if event[0] in ("enter", "unwind")],
+                         [("enter", "outer", [[]]), ("enter", "bad", [[]]),
+                          ("unwind", "bad"), ("unwind", "outer")])
+
+        # Lazy arguments not evaluated yet are hidden behind a placeholder
+        events.clear()
+        lazy = Interpreter(instrumentation=instrumentation, lazy=True)
+        self.assertEqual(lazy.run("def first(a, b) = a\nlet k = 5\nfirst(k + 1, head([]))"), "6")
+        enter = [event for event in events if event[0] == "enter"]
+        self.assertEqual(enter, [("enter", "first", [6, UNEVALUATED])])
+
+    def test_sampler_records_call_stack(self):
+        instrumentation = Instrumentation()
+        # Keep the function on the stack long enough to be sampled
+        instrumentation.on_enter(lambda name, args: time.sleep(0.05) if name == "slow" else None)
+        interpreter = Interpreter(instrumentation=instrumentation)
+
+        with Sampler(interpreter, interval=0.005) as sampler:
+            interpreter.run("def slow(x) = x\ndef outer(x) = slow(x) + 1\nouter(1)")
+
+        self.assertIn(("outer", "slow"), sampler.samples)
+        self.assertGreater(sampler.total_counts()["outer"], 0)
+
+    def test_engines_agree_on_random_programs(self):
+        # Timing outliers are not checked here to keep the test deterministic
+        fuzzer = DifferentialFuzzer(seed=1, outlier_factor=float("inf"))
+        report = fuzzer.run(100)
+        self.assertEqual(report.programs, 100)
+        self.assertEqual(set(report.timings), {engine.name for engine in ENGINES})
+        # Reparsing and optimization are timed apart from evaluation
+        self.assertGreater(report.prepare_timings["reparsed"], report.prepare_timings["eager"])
+        self.assertEqual([finding.reproducer for finding in report.findings], [])
+
+    def test_fuzz_compares_errors(self):
+        def outcome(source, engine):
+            return run_engine(engine, Parser(Lexer(source).tokenize()).parse())
+
+        eager, lazy = ENGINES[0], ENGINES[3]
+        head_error = outcome("head([])", eager)
+        tail_error = outcome("tail([])", eager)
+        self.assertIn("head: empty list", head_error.error)
+        self.assertFalse(diverges(head_error, outcome("head([])", ENGINES[2]), ENGINES[2]))
+        self.assertTrue(diverges(head_error, tail_error, ENGINES[2]))
+        # A lazy engine may fail on a different expression than the eager one
+        self.assertFalse(diverges(head_error, tail_error, lazy))
+
+    def test_to_source_round_trips_programs(self):
+        source = ("import helpers\n"
+                  "def g(l) = [length(l) * 1.5, length(l) * 1.50, helpers.scale, 0.25]\n"
+                  "g([1, 2])")
+        for numeric in ("float", "rational", "decimal"):
+            program = Parser(Lexer(source).tokenize(), numeric).parse()
+            # CSE nodes of an optimized program are rendered as the expressions they cache
+            for level in (0, 2):
+                rendered = to_source(optimize(program, level))
+                self.assertEqual(Parser(Lexer(rendered).tokenize(), numeric).parse(), program)
+
+        reparsed = next(engine for engine in ENGINES if engine.reparse)
+        program = Parser(Lexer("[1.0, 1.00, 0.1 + 0.2]").tokenize(), "decimal").parse()
+        self.assertEqual(run_engine(reparsed, program, numeric="decimal").value,
+                         [repr(Decimal("1.0")), repr(Decimal("1.00")), repr(Decimal("0.3"))])
+
+    def test_shrink_finds_minimal_reproducer(self):
+        def calls_head(program):
+            return "head(" in to_source(program)
+
+        fuzzer = DifferentialFuzzer(seed=3)
+        program = next(p for p in iter(fuzzer.generator.program, None)
+                       if calls_head(p) and program_size(p) > 20)
+        small = shrink(program, calls_head)
+        self.assertTrue(calls_head(small))
+        self.assertLessEqual(program_size(small), 3)
+
     def test_list_operations(self):
         tests = [
             ("[1, 2, 3]", "[1, 2, 3]"),
@@ -71,6 +280,41 @@ class TestInterpreter(unittest.TestCase):
             result = self.interpreter.run(source)
             self.assertEqual(result, expected)
 
+    def test_collection_builtins(self):
+        tests = [
+            ("sort([3, 1, 2])", "Result: [1, 2, 3]"),
+            ("sort([3, 1, 2], fn(a, b) = a > b)", "Result: [3, 2, 1]"),
+            ("sort([[2, 1], [1, 5], [3, 0]], fn(p) = nth(p, 1))", "Result: [[3, 0], [2, 1], [1, 5]]"),
+            ("reverse([1, 2, 3])", "Result: [3, 2, 1]"),
+            ("nth([1, 2, 3], 1)", "2"),
+            ("slice([1, 2, 3, 4], 1, 3)", "Result: [2, 3]"),
+            ("range(4)", "Result: [0, 1, 2, 3]"),
+            ("range(2, 10, 3)", "Result: [2, 5, 8]"),
+            ("zip([1, 2, 3], [4, 5])", "Result: [[1, 4], [2, 5]]"),
+            ("fold(fn(acc, x) = acc + x, 0, range(101))", "5050"),
+        ]
+        for source, expected in tests:
+            self.assertEqual(self.interpreter.run(source), expected)
+
+        # The input list is left unchanged
+        self.assertEqual(self.interpreter.run("let l = [2, 1]\nlet s = sort(l)\nhead(l)"), "2")
+        self.assertIn("nth: index out of bounds", self.interpreter.run("nth([1], 1)"))
+        self.assertIn("sort: elements cannot be compared", self.interpreter.run("sort([1, [2]])"))
+        for function in ("fn(a, b, c) = a", "fn() = 1"):
+            self.assertIn("sort: function must take 1 parameter (a key) or 2 (a comparison)",
+                          self.interpreter.run(f"sort([3, 1, 2], {function})"))
+        limited = Interpreter(ExecutionLimits(max_cells=100))
+        self.assertIn("memory limit", limited.run("range(1000)"))
+
+    def test_user_definitions_shadow_builtins(self):
+        self.interpreter.run("def reverse(l) = 42")
+        self.assertEqual(self.interpreter.run("reverse([1, 2])"), "42")
+
+        # Arguments of a user function named like a strict built-in stay lazy
+        lazy = Interpreter(lazy=True)
+        self.assertEqual(lazy.run("def reverse(a) = 0\nlet x = head([])\nreverse(x)"), "0")
+        self.assertEqual(lazy.run("def f(reverse, a) = reverse(a)\nf(fn(a) = 1, head([]))"), "1")
+
     def test_bubble_sort(self):
         # Test the complete bubble sort implementation
         with open('fp_lang/examples/bubble_sort.fp', 'r') as f:
@@ -79,5 +323,249 @@ class TestInterpreter(unittest.TestCase):
         result = self.interpreter.run(source)
         self.assertEqual(result, "[11, 12, 22, 25, 34, 64, 90]")
 
+    def test_step_limit(self):
+        source = """
+        def loop(n) = loop(n + 1)
+        loop(0)
+        """
+        interpreter = Interpreter(ExecutionLimits(max_steps=100))
+        result = interpreter.run(source)
+        self.assertIn("step limit of 100 exceeded", result)
+
+    def test_depth_limit(self):
+        source = """
+        def loop(n) = loop(n + 1)
+        loop(0)
+        """
+        interpreter = Interpreter(ExecutionLimits(max_depth=50))
+        result = interpreter.run(source)
+        self.assertIn("call depth limit of 50 exceeded", result)
+
+        # Depths well beyond Python's default recursion limit are reachable
+        count = "def count(n) = if n < 1 then 0 else 1 + count(n - 1)\ncount(%d)"
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(1000)
+        try:
+            for lazy in (False, True):
+                interpreter = Interpreter(ExecutionLimits(max_depth=500), lazy=lazy)
+                self.assertEqual(interpreter.run(count % 490), "490")
+                self.assertIn("call depth limit of 500 exceeded", interpreter.run(count % 600))
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+
+    def test_memory_limit(self):
+        source = """
+        def grow(lst) = grow(lst + lst)
+        grow([1])
+        """
+        interpreter = Interpreter(ExecutionLimits(max_cells=1000))
+        result = interpreter.run(source)
+        self.assertIn("memory limit of 1000 list cells exceeded", result)
+
+    def test_timeout_raises_evaluation_error(self):
+        with open('fp_lang/examples/bubble_sort.fp', 'r') as f:
+            source = f.read()
+
+        evaluator = Evaluator(None, Environment(), ExecutionLimits(timeout=0))
+        with self.assertRaises(EvaluationError):
+            for expr in Parser(Lexer(source).tokenize()).parse():
+                evaluator.ast = expr
+                evaluator.evaluate()
+
+    def test_import_module(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'helpers.fp'), 'w') as f:
+                f.write("def double(x) = x * 2\n")
+            registry = ModuleRegistry([directory])
+
+            interpreter = Interpreter(registry=registry)
+            result = interpreter.run("import helpers\nhelpers.double(21)")
+            self.assertEqual(result, "42")
+
+            # A second session reuses the module evaluated by the first one
+            env = registry.load('helpers')
+            other = Interpreter(registry=registry)
+            self.assertEqual(other.run("import helpers\nhelpers.double(5)"), "10")
+            self.assertIs(registry.load('helpers'), env)
+
+    def test_module_uses_importing_numeric_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'consts.fp'), 'w') as f:
+                f.write("def third(x) = x * 0.5 / 1.5\n")
+            registry = ModuleRegistry([directory])
+            self.assertEqual(Interpreter(registry=registry).run("import consts\nconsts.third(1)"),
+                             str(1 * 0.5 / 1.5))
+            rational = Interpreter(registry=registry, numeric="rational")
+            self.assertEqual(rational.run("import consts\nconsts.third(1)"), "1/3")
+
+    def test_module_runs_with_caller_limits(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'helpers.fp'), 'w') as f:
+                f.write("def mk(n) = range(n)\ndef total(l) = fold(fn(a, x) = a + x, 0, l)\n")
+            registry = ModuleRegistry([directory])
+            self.assertEqual(Interpreter(registry=registry).run("import helpers\nlength(helpers.mk(1000))"),
+                             "1000")
+
+            # Built-ins called from module code use the calling program's limits and hooks
+            limited = Interpreter(ExecutionLimits(max_cells=100), registry=registry)
+            self.assertIn("memory limit", limited.run("import helpers\nhelpers.mk(1000)"))
+            limited = Interpreter(ExecutionLimits(max_steps=1000), registry=registry)
+            self.assertIn("step limit", limited.run("import helpers\nhelpers.total(range(10000))"))
+
+            calls = []
+            instrumentation = Instrumentation()
+            instrumentation.on_builtin(lambda name, args, result, elapsed: calls.append(name))
+            Interpreter(registry=registry, instrumentation=instrumentation).run("import helpers\nhelpers.mk(3)")
+            self.assertEqual(calls, ["range"])
+
+            # The module's top level is evaluated under the importing program's budget
+            fresh = Interpreter(ExecutionLimits(max_steps=1), registry=ModuleRegistry([directory]))
+            self.assertIn("step limit", fresh.run("import helpers\nhelpers.mk(2)"))
+
+    def test_import_is_lazy(self):
+        registry = ModuleRegistry([])
+        interpreter = Interpreter(registry=registry)
+        # The missing module is only an error once one of its members is used
+        self.assertEqual(interpreter.run("import missing\n1 + 1"), "2")
+        self.assertIn("Module 'missing' not found", interpreter.run("missing.f(1)"))
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'helpers.fp'), 'w') as f:
+                f.write("def double(x) = x * 2\n")
+            interpreter = Interpreter(registry=ModuleRegistry([directory]), lazy=True)
+            interpreter.run("import helpers\n"
+                            "def fact(n) = if n < 2 then 1 else n * fact(n - 1)\n"
+                            "def adder(n) = let h = head\n fn(l) = h(l) + helpers.double(n)\n"
+                            "def add3(l) = adder(3)(l)")
+            path = os.path.join(directory, 'prelude.snap')
+            interpreter.save_snapshot(path)
+
+            # The restored session needs neither the source nor the module file
+            os.remove(os.path.join(directory, 'helpers.fp'))
+            restored = Interpreter(registry=ModuleRegistry([directory]))
+            restored.load_snapshot(path)
+            self.assertEqual(restored.run("fact(5)"), "120")
+            self.assertEqual(restored.run("add3([1, 2])"), "7")
+            self.assertEqual(restored.run("helpers.double(4)"), "8")
+
+            with open(path, 'wb') as f:
+                f.write(b"not a snapshot")
+            with self.assertRaises(EvaluationError):
+                restored.load_snapshot(path)
+
+    def test_snapshot_corruption_is_an_evaluation_error(self):
+        with tempfile.TemporaryDirectory() as directory:
+            interpreter = Interpreter()
+            interpreter.run("def scale(l) = [head(l) * 1.5, 2, \"two\"]\nlet k = 7")
+            path = os.path.join(directory, 'prelude.snap')
+            interpreter.save_snapshot(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            damaged = [data[:n] for n in range(len(data))]
+            for i in range(8, len(data)):
+                for byte in (0x00, 0x7f, 0xff, data[i] ^ 0x01):
+                    damaged.append(data[:i] + bytes([byte]) + data[i + 1:])
+            for content in damaged:
+                with open(path, 'wb') as f:
+                    f.write(content)
+                try:
+                    Interpreter().load_snapshot(path)
+                except EvaluationError:
+                    pass
+
+    def test_snapshot_keeps_numeric_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'helpers.fp'), 'w') as f:
+                f.write("def tenth(x) = x * 0.1\n")
+            interpreter = Interpreter(registry=ModuleRegistry([directory]), numeric="decimal")
+            interpreter.run("import helpers\ndef third(x) = x / 3 + helpers.tenth(1)")
+            path = os.path.join(directory, 'prelude.snap')
+            interpreter.save_snapshot(path)
+
+            # Restoring in another mode is refused and leaves the registry untouched
+            registry = ModuleRegistry([directory])
+            with self.assertRaises(EvaluationError):
+                Interpreter(registry=registry).load_snapshot(path)
+            self.assertEqual(Interpreter(registry=registry).run("import helpers\nhelpers.tenth(3)"),
+                             str(3 * 0.1))
+
+            os.remove(os.path.join(directory, 'helpers.fp'))
+            restored = Interpreter(registry=ModuleRegistry([directory]), numeric="decimal")
+            restored.load_snapshot(path)
+            self.assertEqual(restored.run("third(1.5)"), "0.6")
+            self.assertEqual(restored.run("helpers.tenth(3)"), "0.3")
+
+    def test_snapshot_refuses_foreign_globals(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'evil.snap')
+            marker = os.path.join(directory, 'pwned')
+            for module, name in [(b"fp_lang.interpreter", b"os.system"), (b"os", b"system")]:
+                # GLOBAL module name, then call it with a shell command
+                payload = (b"c" + module + b"\n" + name + b"\n"
+                           + b"(V" + f"touch {marker}".encode() + b"\ntR.")
+                with open(path, 'wb') as f:
+                    f.write(b"FPSNAP\x02\x00" + payload)
+                with self.assertRaises(EvaluationError):
+                    Interpreter().load_snapshot(path)
+                self.assertFalse(os.path.exists(marker))
+
+    def test_run_async_interleaves_and_cancels(self):
+        fib = "def fib(n) = if n < 2 then n else fib(n - 1) + fib(n - 2)\nfib(%d)"
+        calls = []
+
+        def traced(task_id):
+            instrumentation = Instrumentation()
+            instrumentation.on_enter(lambda name, args: calls.append(task_id))
+            return Interpreter(instrumentation=instrumentation)
+
+        async def main():
+            scheduler = Scheduler(slice_steps=500)
+            results = await asyncio.gather(scheduler.run(traced(0), fib % 12),
+                                           scheduler.run(traced(1), fib % 12))
+            self.assertEqual(results, ["144", "144"])
+            # Both tasks made progress before either finished
+            self.assertLess(calls.index(1), len(calls) - 1 - calls[::-1].index(0))
+
+            task = asyncio.create_task(scheduler.run(Interpreter(), fib % 40))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            limited = Interpreter(ExecutionLimits(max_steps=1000))
+            self.assertIn("step limit", await limited.run_async(fib % 12))
+
+        asyncio.run(main())
+
+    def test_run_async_slow_script_does_not_stall_others(self):
+        fib = "def fib(n) = if n < 2 then n else fib(n - 1) + fib(n - 2)\nfib(%d)"
+
+        async def main():
+            scheduler = Scheduler(slice_steps=500, max_tasks=8)
+            slow = asyncio.create_task(scheduler.run(Interpreter(), fib % 40))
+            # More short scripts than admitted tasks all finish while the slow one runs
+            results = await asyncio.wait_for(
+                asyncio.gather(*(scheduler.run(Interpreter(), fib % 5) for _ in range(40))), 10)
+            self.assertEqual(results, ["5"] * 40)
+            self.assertFalse(slow.done())
+            slow.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await slow
+
+            # Offloaded evaluations are stopped by cancellation too
+            interpreter = Interpreter()
+            offloaded = asyncio.create_task(Scheduler(None).run(interpreter, fib % 40))
+            await asyncio.sleep(0.05)
+            offloaded.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await offloaded
+            steps = interpreter.evaluator.steps
+            await asyncio.sleep(0.05)
+            self.assertEqual(interpreter.evaluator.steps, steps)
+
+        asyncio.run(main())
+
 if __name__ == '__main__':
     unittest.main()